@@ -14,44 +14,17 @@ from django.shortcuts import render_to_response
 from django.template import RequestContext
 from django.utils import timezone
 from django.views.decorators.http import require_http_methods
-from login_frontend.models import Browser, User, BrowserLogin, BrowserUsers, Log
+from login_frontend.models import Browser, User, BrowserLogin, BrowserUsers, Log, write_queued_user_logs
 from login_frontend.utils import get_and_refresh_user, paginate
 from login_frontend.views import protect_view
+from login_frontend.request_log import request_logger
 import logging
-import sys
-import os
 from django_statsd.clients import statsd as sd
 
 log = logging.getLogger(__name__)
 user_log = logging.getLogger(__name__)
 
-@sd.timer("admin_frontend.views.custom_log")
-def custom_log(request, message, **kwargs):
-    """ Automatically adds remote IP address and public browser ID to log entries """
-    try:
-        raise Exception
-    except:
-        stack = sys.exc_info()[2].tb_frame.f_back
-    if stack is not None:
-        stack = stack.f_back
-    while hasattr(stack, "f_code"):
-        co = stack.f_code
-        filename = os.path.normcase(co.co_filename)
-        filename = co.co_filename
-        lineno = stack.f_lineno
-        co_name = co.co_name
-        break
-
-    level = kwargs.get("level", "info")
-    method = getattr(user_log, level)
-    remote_addr = request.remote_ip
-    bid_public = username = ""
-    if hasattr(request, "browser") and request.browser:
-        bid_public = request.browser.bid_public
-        if request.browser.user:
-            username = request.browser.user.username
-    method("[%s:%s:%s] %s - %s - %s - %s", filename, lineno, co_name,
-                            remote_addr, username, bid_public, message)
+custom_log = request_logger(user_log)
 
 @require_http_methods(["GET"])
 @protect_view("indexview", required_level=Browser.L_STRONG, admin_only=True)
@@ -151,6 +124,7 @@ def userdetails(request, **kwargs):
             messages.info(request, "Revoked Authenticator configuration for %s" % username)
         return HttpResponseRedirect(reverse("admin_frontend.views.userdetails", args=(username, )))
 
+    write_queued_user_logs([username])
     ret["entries"] = Log.objects.filter(user=ret["auser"])[0:25]
 
     ret["duser"] = get_object_or_404(DjangoUser, username=username)
@@ -164,7 +138,7 @@ def logins(request):
     """ Shows list of active logins for all users. """
     ret = {}
     custom_log(request, "Admin: list of active logins")
-    entries = BrowserLogin.objects.filter(signed_out=False).filter(expires_at__gte=timezone.now())
+    entries = BrowserLogin.objects.filter(signed_out=False).filter(expires_at__gte=timezone.now()).select_related("browser", "user")
     ret["entries"] = paginate(request, entries)
     return render_to_response("admin_frontend/logins.html", ret, context_instance=RequestContext(request))
 
@@ -186,6 +160,8 @@ def browserdetails(request, **kwargs):
     bid_public = kwargs.get("bid_public")
     ret["abrowser"] = get_object_or_404(Browser, bid_public=bid_public)
     ret["logins"] = BrowserLogin.objects.filter(browser=ret["abrowser"])
+    if ret["abrowser"].user_id:
+        write_queued_user_logs([ret["abrowser"].user_id])
     ret["entries"] = Log.objects.filter(bid_public=bid_public)[0:100]
     username = None
     if ret["abrowser"].user:
@@ -201,6 +177,8 @@ def logs(request, **kwargs):
     custom_log(request, "Admin: logs")
     bid_public = kwargs.get("bid_public")
     username = kwargs.get("username")
+    # Show the newest entries, even if those are still queued. Queues of all
+    # users are written only by huey task.
     if bid_public:
         entries = Log.objects.filter(bid_public=bid_public)
         username = None
@@ -208,12 +186,14 @@ def logs(request, **kwargs):
             ret["abrowser"] = Browser.objects.get(bid_public=bid_public)
             if ret["abrowser"].user:
                 username = ret["abrowser"].user.username
+                write_queued_user_logs([username])
         except Browser.DoesNotExist:
             ret["missing_browser"] = True
         custom_log(request, "Admin: entries for %s (%s)" % (bid_public, username))
 
     elif username:
         ret["auser"] = get_object_or_404(User, username=username)
+        write_queued_user_logs([username])
         entries = Log.objects.filter(user=ret["auser"])
         custom_log(request, "Admin: entries for %s" % username)
     else:
@@ -0,0 +1,220 @@
+"""
+CSP report ingestion.
+
+Duplicate reports are detected from redis keys of report fingerprints,
+without database queries. Fingerprints expire after
+settings.CSP_FINGERPRINT_TIMEOUT seconds. Reports are rate limited per
+browser (or IP address, if browser is not known). With
+settings.CSP_REPORTS_ASYNC, accepted reports are queued to redis and written
+in batches by huey task.
+"""
+
+from cspreporting.models import CSPReport, CSPViolationRollup
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from django_statsd.clients import statsd as sd
+from hashlib import sha1
+import datetime
+import json
+import logging
+import redis
+import time
+
+log = logging.getLogger(__name__)
+
+r = redis.Redis()
+
+FINGERPRINT_KEY = "csp-fingerprint-%s"
+RATE_KEY = "csp-rate-%s-%s"
+QUEUE_KEY = "csp-report-queue"
+DEAD_LETTER_KEY = "csp-report-dead-letter"
+MAX_ATTEMPTS = 5 # Queued reports failing this many times are moved to DEAD_LETTER_KEY
+MAX_INTEGER = 2 ** 31 - 1
+
+ACCEPTED = "accepted"
+DUPLICATE = "duplicate"
+DROPPED = "dropped"
+
+__all__ = ["ACCEPTED", "DUPLICATE", "DROPPED", "ingest_report", "write_queued_reports", "update_rollups"]
+
+
+def get_fingerprint(username, bid_public, data):
+    """ Returns redis key for report fingerprint. Reports with the same
+    fingerprint are duplicates. """
+    fields = (username, bid_public, data.get("source-file"), data.get("line-number"), data.get("violated-directive"))
+    return FINGERPRINT_KEY % sha1(json.dumps(fields)).hexdigest()[:16]
+
+
+def to_integer(value):
+    """ Returns value as integer that fits to IntegerField, or None """
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    if abs(value) > MAX_INTEGER:
+        return None
+    return value
+
+
+def to_text(value):
+    """ Returns value if it is a string, or None """
+    if isinstance(value, basestring):
+        return value
+    return None
+
+
+def is_rate_limited(rate_id):
+    """ Returns True if rate_id has sent more than settings.CSP_REPORTS_PER_MINUTE reports during current minute """
+    key = RATE_KEY % (rate_id, int(time.time() / 60))
+    pipe = r.pipeline()
+    pipe.incr(key)
+    pipe.expire(key, 60)
+    (count, _) = pipe.execute()
+    return count > settings.CSP_REPORTS_PER_MINUTE
+
+
+def ingest_report(username, bid_public, remote_ip, csp_raw, data):
+    """ Stores or queues validated CSP report. Returns ACCEPTED, DUPLICATE or DROPPED. """
+    if is_rate_limited(bid_public or remote_ip):
+        sd.incr("cspreporting.ingest.dropped.rate_limit", 1)
+        return DROPPED
+
+    fingerprint = get_fingerprint(username, bid_public, data)
+    if not r.set(fingerprint, int(time.time()), nx=True, ex=settings.CSP_FINGERPRINT_TIMEOUT):
+        sd.incr("cspreporting.ingest.duplicate", 1)
+        return DUPLICATE
+
+    report = {
+        "username": username,
+        "bid_public": bid_public,
+        "reported_at": time.time(),
+        "csp_raw": csp_raw,
+        # Reports are sent by browsers without authentication. Invalid
+        # values are not stored, so that they can not fail database writes.
+        "document_uri": to_text(data.get("document-uri")),
+        "referrer": to_text(data.get("referrer")),
+        "violated_directive": to_text(data.get("violated-directive")),
+        "blocked_uri": to_text(data.get("blocked-uri")),
+        "source_file": to_text(data.get("source-file")),
+        "line_number": to_integer(data.get("line-number")),
+        "column_number": to_integer(data.get("column-number")),
+        "status_code": to_integer(data.get("status-code")),
+    }
+
+    if not settings.CSP_REPORTS_ASYNC:
+        try:
+            store_reports([report])
+        except:
+            # Allow the same report again.
+            r.delete(fingerprint)
+            raise
+        sd.incr("cspreporting.ingest.accepted", 1)
+        return ACCEPTED
+
+    if r.llen(QUEUE_KEY) >= settings.CSP_QUEUE_MAX_LENGTH:
+        # Allow the same report again once the queue has been written.
+        r.delete(fingerprint)
+        sd.incr("cspreporting.ingest.dropped.queue_full", 1)
+        return DROPPED
+    r.rpush(QUEUE_KEY, json.dumps(report))
+    sd.incr("cspreporting.ingest.accepted", 1)
+    return ACCEPTED
+
+
+def store_reports(reports):
+    """ Writes list of report dicts to database """
+    objects = []
+    for report in reports:
+        report = dict(report)
+        report.pop("attempts", None)
+        report["reported_at"] = datetime.datetime.fromtimestamp(report["reported_at"], timezone.utc)
+        objects.append(CSPReport(**report))
+    with transaction.atomic():
+        CSPReport.objects.bulk_create(objects, batch_size=settings.CSP_BATCH_SIZE)
+        update_rollups(objects)
+
+
+def get_rollup_key(source_file, violated_directive, day):
+    return sha1(json.dumps([source_file, violated_directive, day.isoformat()])).hexdigest()
+
+
+def update_rollups(reports):
+    """ Adds CSPReport objects to CSPViolationRollup counts. One query per
+    (source file, violated directive, day) in reports. """
+    counts = {}
+    for report in reports:
+        day = timezone.localtime(report.reported_at).date()
+        key = (report.source_file, report.violated_directive, day)
+        (count, last_reported_at) = counts.get(key, (0, report.reported_at))
+        counts[key] = (count + 1, max(last_reported_at, report.reported_at))
+
+    for ((source_file, violated_directive, day), (count, last_reported_at)) in counts.items():
+        rollup_key = get_rollup_key(source_file, violated_directive, day)
+        rollups = CSPViolationRollup.objects.filter(rollup_key=rollup_key)
+        if rollups.update(count=F("count") + count, last_reported_at=last_reported_at):
+            continue
+        try:
+            with transaction.atomic():
+                CSPViolationRollup.objects.create(rollup_key=rollup_key, source_file=source_file, violated_directive=violated_directive,
+                                                  day=day, count=count, last_reported_at=last_reported_at)
+        except IntegrityError:
+            # Created by another worker in the meantime
+            rollups.update(count=F("count") + count, last_reported_at=last_reported_at)
+
+
+def store_queued_entries(entries):
+    """ Writes queued reports one at a time. Failed reports are queued
+    again, and moved to DEAD_LETTER_KEY after MAX_ATTEMPTS failures.
+    Returns number of reports written. """
+    written = 0
+    pipe = r.pipeline()
+    for entry in entries:
+        (report, attempts) = (None, 0)
+        try:
+            report = json.loads(entry)
+            attempts = report.get("attempts", 0)
+            store_reports([report])
+            written += 1
+            continue
+        except Exception, e:
+            log.error("Writing queued CSP report failed: %s", e)
+        if not isinstance(report, dict) or attempts + 1 >= MAX_ATTEMPTS:
+            log.error("Giving up writing queued CSP report: %s", entry)
+            sd.incr("cspreporting.ingest.dead_letter", 1)
+            pipe.rpush(DEAD_LETTER_KEY, entry)
+        else:
+            report["attempts"] = attempts + 1
+            pipe.rpush(QUEUE_KEY, json.dumps(report))
+    pipe.execute()
+    return written
+
+
+@sd.timer("cspreporting.ingest.write_queued_reports")
+def write_queued_reports():
+    """ Writes all queued reports to database. Returns number of reports written. """
+    written = 0
+    while True:
+        pipe = r.pipeline()
+        pipe.lrange(QUEUE_KEY, 0, settings.CSP_BATCH_SIZE - 1)
+        pipe.ltrim(QUEUE_KEY, settings.CSP_BATCH_SIZE, -1)
+        (entries, _) = pipe.execute()
+        if not entries:
+            break
+        failed = False
+        try:
+            store_reports([json.loads(entry) for entry in entries])
+            batch_written = len(entries)
+        except Exception, e:
+            # Single invalid report fails the whole batch. Write reports
+            # one by one, so that it does not block the queue.
+            log.error("Writing %s queued CSP reports failed: %s. Writing reports separately.", len(entries), e)
+            batch_written = store_queued_entries(entries)
+            failed = True
+        written += batch_written
+        sd.incr("cspreporting.ingest.written", batch_written)
+        # Failed reports were queued again. Those are retried on the next run.
+        if failed or len(entries) < settings.CSP_BATCH_SIZE:
+            break
+    return written
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from cspreporting.ingest import update_rollups
+from cspreporting.models import CSPReport, CSPViolationRollup
+from django.db import transaction
+
+
+class Command(BaseCommand): # pragma: no cover
+    args = ''
+    help = 'Rebuilds CSP violation rollups from stored CSP reports'
+
+    def handle(self, *args, **options):
+        reports = CSPReport.objects.only("source_file", "violated_directive", "reported_at").order_by("id")
+        count = 0
+        with transaction.atomic():
+            CSPViolationRollup.objects.all().delete()
+            batch = []
+            for report in reports.iterator():
+                batch.append(report)
+                if len(batch) >= 1000:
+                    update_rollups(batch)
+                    count += len(batch)
+                    batch = []
+            update_rollups(batch)
+            count += len(batch)
+        self.stdout.write("Added %s reports to %s rollups" % (count, CSPViolationRollup.objects.count()))
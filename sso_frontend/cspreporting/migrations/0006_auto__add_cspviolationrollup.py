@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding model 'CSPViolationRollup'
+        db.create_table(u'cspreporting_cspviolationrollup', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('rollup_key', self.gf('django.db.models.fields.CharField')(unique=True, max_length=40)),
+            ('source_file', self.gf('django.db.models.fields.CharField')(db_index=True, max_length=2000, null=True, blank=True)),
+            ('violated_directive', self.gf('django.db.models.fields.CharField')(max_length=2000, null=True, blank=True)),
+            ('day', self.gf('django.db.models.fields.DateField')(db_index=True)),
+            ('count', self.gf('django.db.models.fields.IntegerField')(default=0)),
+            ('last_reported_at', self.gf('django.db.models.fields.DateTimeField')()),
+        ))
+        db.send_create_signal(u'cspreporting', ['CSPViolationRollup'])
+
+
+    def backwards(self, orm):
+        # Deleting model 'CSPViolationRollup'
+        db.delete_table(u'cspreporting_cspviolationrollup')
+
+
+    models = {
+        u'cspreporting.cspreport': {
+            'Meta': {'ordering': "['-reported_at']", 'object_name': 'CSPReport'},
+            'bid_public': ('django.db.models.fields.CharField', [], {'max_length': '37', 'null': 'True', 'blank': 'True'}),
+            'blocked_uri': ('django.db.models.fields.CharField', [], {'max_length': '2000', 'null': 'True', 'blank': 'True'}),
+            'column_number': ('django.db.models.fields.IntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'csp_raw': ('django.db.models.fields.TextField', [], {}),
+            'document_uri': ('django.db.models.fields.CharField', [], {'max_length': '2000', 'null': 'True', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'line_number': ('django.db.models.fields.IntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'referrer': ('django.db.models.fields.CharField', [], {'max_length': '2000', 'null': 'True', 'blank': 'True'}),
+            'reported_at': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now', 'db_index': 'True'}),
+            'source_file': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '2000', 'null': 'True', 'blank': 'True'}),
+            'status_code': ('django.db.models.fields.IntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'username': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '100', 'null': 'True', 'blank': 'True'}),
+            'violated_directive': ('django.db.models.fields.CharField', [], {'max_length': '2000', 'null': 'True', 'blank': 'True'})
+        },
+        u'cspreporting.cspviolationrollup': {
+            'Meta': {'ordering': "['-day', '-count']", 'object_name': 'CSPViolationRollup'},
+            'count': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'day': ('django.db.models.fields.DateField', [], {'db_index': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_reported_at': ('django.db.models.fields.DateTimeField', [], {}),
+            'rollup_key': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '40'}),
+            'source_file': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '2000', 'null': 'True', 'blank': 'True'}),
+            'violated_directive': ('django.db.models.fields.CharField', [], {'max_length': '2000', 'null': 'True', 'blank': 'True'})
+        }
+    }
+
+    complete_apps = ['cspreporting']
\ No newline at end of file
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from login_frontend.models import User
 
 # Create your models here.
@@ -6,7 +7,7 @@ class CSPReport(models.Model):
     username = models.CharField(max_length=100, null=True, blank=True, db_index=True)
     bid_public = models.CharField(max_length=37, null=True, blank=True) # UUID
 
-    reported_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    reported_at = models.DateTimeField(default=timezone.now, editable=False, db_index=True)
 
     csp_raw = models.TextField()
     document_uri = models.CharField(max_length=2000, blank=True, null=True)
@@ -24,3 +25,20 @@ class CSPReport(models.Model):
 
     def __unicode__(self):
         return u"%s - %s - %s - %s" % (self.username, self.bid_public, self.reported_at, self.source_file)
+
+
+class CSPViolationRollup(models.Model):
+    """ Number of CSP reports per source file, violated directive and day.
+    Updated when reports are written to database. """
+    rollup_key = models.CharField(max_length=40, unique=True) # sha1 of source_file, violated_directive and day
+    source_file = models.CharField(max_length=2000, blank=True, null=True, db_index=True)
+    violated_directive = models.CharField(max_length=2000, blank=True, null=True)
+    day = models.DateField(db_index=True)
+    count = models.IntegerField(default=0)
+    last_reported_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ["-day", "-count"]
+
+    def __unicode__(self):
+        return u"%s - %s - %s - %s" % (self.day, self.source_file, self.violated_directive, self.count)
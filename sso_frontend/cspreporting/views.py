@@ -7,8 +7,10 @@ Stores reports in database, and outputs Django logging.
 In database, only non-duplicate records are added.
 """
 
-from cspreporting.models import CSPReport
+from cspreporting.ingest import ingest_report, ACCEPTED, DUPLICATE
+from cspreporting.models import CSPReport, CSPViolationRollup
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.db.models import Count, Max, Sum
 from django.http import HttpResponse
 from django.shortcuts import render_to_response
 from django.template import RequestContext
@@ -21,9 +23,6 @@ import json
 import logging
 import re
 from django_statsd.clients import statsd as sd
-from django.core.cache import get_cache
-
-dcache = get_cache("default")
 
 log = logging.getLogger(__name__)
 user_log = logging.getLogger(__name__)
@@ -33,41 +32,55 @@ def test_csp(request, *args, **kwargs):
     """ Outputs page that violates CSP policy """
     return render_to_response("cspreporting/fail.html", {}, context_instance=RequestContext(request))
 
-@require_http_methods(["GET"])
-@protect_view("indexview", required_level=Browser.L_STRONG, admin_only=True)
-def view_warnings(request):
-    """ Shows potential misconfigurations """
-    ret = {}
-    entries = CSPReport.objects.filter(source_file__startswith='http')
+def paginate(request, entries):
+    """ Returns page of entries for the page number in request """
     paginator = Paginator(entries, 100)
     page = request.GET.get("page")
     try:
         entries = paginator.page(page)
     except PageNotAnInteger:
         entries = paginator.page(1)
-        page = 1
     except EmptyPage:
         entries = paginator.page(paginator.num_pages)
-        page = paginator.num_pages
     entries.pagerange = range(1, paginator.num_pages+1)
+    return entries
 
+def add_browsers(request, entries):
+    """ Sets entry.browser for each report, with a single query """
+    bid_publics = set([entry.bid_public for entry in entries if entry.bid_public])
     browsers = {}
-
+    if bid_publics:
+        browsers = dict([(browser.bid_public, browser) for browser in Browser.objects.filter(bid_public__in=bid_publics)])
     for entry in entries:
         if entry.bid_public == request.browser.bid_public:
             entry.current_browser = True
-        browser = browsers.get(entry.bid_public)
-        if not browser:
-            try:
-                browser = Browser.objects.get(bid_public=entry.bid_public)
-                browsers[entry.bid_public] = browser
-            except Browser.DoesNotExist:
-                pass
-        if browser:
-            entry.browser = browser
-        entry.linked_source_file = entry.source_file
+        entry.browser = browsers.get(entry.bid_public)
 
-    ret["entries"] = entries
+@require_http_methods(["GET"])
+@protect_view("indexview", required_level=Browser.L_STRONG, admin_only=True)
+def view_warnings(request):
+    """ Shows potential misconfigurations: number of reports per source
+    file and violated directive, most reported first. If source_file is
+    given, latest reports for it are shown.
+    """
+    ret = {}
+    source_file = request.GET.get("source_file")
+    if source_file:
+        reports = CSPReport.objects.filter(source_file=source_file)
+        violated_directive = request.GET.get("violated_directive")
+        if violated_directive:
+            reports = reports.filter(violated_directive=violated_directive)
+        reports = list(reports[:100])
+        add_browsers(request, reports)
+        for entry in reports:
+            entry.linked_source_file = entry.source_file
+        ret["source_file"] = source_file
+        ret["reports"] = reports
+
+    entries = CSPViolationRollup.objects.filter(source_file__startswith='http').values("source_file", "violated_directive").annotate(reports=Sum("count"), last_reported_at=Max("last_reported_at")).order_by("-reports")
+    ret["entries"] = paginate(request, entries)
+    ret["prev_text"] = "Previous"
+    ret["next_text"] = "Next"
 
     return render_to_response("cspreporting/view_warnings.html", ret, context_instance=RequestContext(request))
 
@@ -81,38 +94,13 @@ def view_reports(request):
 
     ret = {}
     ret["ausername"] = request.browser.user.username
-    entries = CSPReport.objects.filter(username=request.browser.user.username)
-    paginator = Paginator(entries, 100)
-    page = request.GET.get("page")
-    try:
-        entries = paginator.page(page)
-    except PageNotAnInteger:
-        entries = paginator.page(1)
-        page = 1
-    except EmptyPage:
-        entries = paginator.page(paginator.num_pages)
-        page = paginator.num_pages
-    entries.pagerange = range(1, paginator.num_pages+1)
-
-    browsers = {}
+    reports = CSPReport.objects.filter(username=request.browser.user.username)
+    ret["violations"] = reports.order_by().values("source_file", "violated_directive").annotate(reports=Count("id"), last_reported_at=Max("reported_at")).order_by("-reports")
+    entries = paginate(request, reports)
+    sd.incr("cspreporting.views.view_reports.load_entry", len(entries))
+    add_browsers(request, entries)
 
     for entry in entries:
-        sd.incr("cspreporting.views.view_reports.load_entry", 1)
-        if entry.bid_public == request.browser.bid_public:
-            entry.current_browser = True
-        browser = browsers.get(entry.bid_public)
-        if not browser:
-            try:
-                browser = Browser.objects.get(bid_public=entry.bid_public)
-                browsers[entry.bid_public] = browser
-                sd.incr("cspreporting.views.view_reports.get_browser.database", 1)
-            except Browser.DoesNotExist:
-                pass
-        else:
-            sd.incr("cspreporting.views.view_reports.get_browser.cache", 1)
-
-        if browser:
-            entry.browser = browser
         entry.linked_source_file = entry.source_file
         if entry.source_file and entry.source_file.startswith("chrome-extension://"):
             extension_id = entry.source_file.replace("chrome-extension://", "")
@@ -157,21 +145,9 @@ def log_report(request, *args, **kwargs):
         sd.incr("cspreporting.views.log_report.missing_mandatory_key", 1)
         return HttpResponse("Invalid CSP report: missing mandatory keys")
 
-    r_k = "csp-recorded-%s-%s-%s-%s-%s" % (username, bid_public, data.get("source-file"), data.get("line-number"), data.get("violated-directive"))
-
-    if dcache.get(r_k) or CSPReport.objects.filter(username=username, bid_public=bid_public).filter(source_file=data.get("source-file"), 
-            line_number=data.get("line-number"), violated_directive=data.get("violated-directive")).count() > 0:
-
-        sd.incr("cspreporting.views.log_report.duplicate", 1)
+    status = ingest_report(username, bid_public, remote_ip, csp_data, data)
+    if status == DUPLICATE:
         return HttpResponse("Duplicate CSP report. Not stored.")
-
-    dcache.set(r_k, True, 86400 * 7)
-
-    sd.incr("cspreporting.views.log_report.created", 1)
-    a = CSPReport.objects.create(username=username, bid_public=bid_public, csp_raw=csp_data, document_uri=data.get("document-uri"),
-                                      referrer=data.get("referrer"), violated_directive=data.get("violated-directive"),
-                                      blocked_uri=data.get("blocked-uri"), source_file=data.get("source-file"),
-                                      line_number=data.get("line-number"), column_number=data.get("column-number"),
-                                      status_code=data.get("status-code"))
-
-    return HttpResponse("OK %s" % a)
+    if status != ACCEPTED:
+        return HttpResponse("Too many CSP reports. Not stored.")
+    return HttpResponse("OK")
@@ -27,19 +27,19 @@ else:
 from login_frontend.models import *
 from login_frontend.providers import pubtkt_logout
 from login_frontend.send_sms import send_sms
+from login_frontend.sms_queue import queue_sms, get_sms_status, redact_phone
 from login_frontend.utils import save_timing_data, get_geoip_string, redirect_with_get_params, redir_to_sso, paginate, get_return_url
+from login_frontend.request_log import request_logger
 from ratelimit.decorators import ratelimit
 import datetime
 import json
 import logging
 import math
-import os
 import pyotp
 import qrcode
 import re
 import redis
 from django_statsd.clients import statsd as sd
-import sys
 import time
 import urllib
 import urlparse
@@ -53,33 +53,7 @@ r = redis.Redis()
 
 user_log = logging.getLogger("users.%s" % __name__)
 
-@sd.timer("login_frontend.authentication_views.custom_log")
-def custom_log(request, message, **kwargs):
-    """ Automatically logs username, remote IP and bid_public """
-    try:
-        raise Exception
-    except:
-        stack = sys.exc_info()[2].tb_frame.f_back
-    if stack is not None:
-        stack = stack.f_back
-    while hasattr(stack, "f_code"):
-        co = stack.f_code
-        filename = os.path.normcase(co.co_filename)
-        filename = co.co_filename
-        lineno = stack.f_lineno
-        co_name = co.co_name
-        break
-
-    level = kwargs.get("level", "info")
-    method = getattr(user_log, level)
-    remote_addr = request.remote_ip
-    bid_public = username = ""
-    if hasattr(request, "browser") and request.browser:
-        bid_public = request.browser.bid_public
-        if request.browser.user:
-            username = request.browser.user.username
-    method("[%s:%s:%s] %s - %s - %s - %s", filename, lineno, co_name,
-                            remote_addr, username, bid_public, message)
+custom_log = request_logger(user_log)
 
 @sd.timer("login_frontend.authentication_views.protect_view")
 def protect_view(current_step, **main_kwargs):
@@ -266,8 +240,7 @@ def authenticate_with_password(request):
                     # This is a special case for emulating legacy system:
                     # - no two-factor authentication
                     # - all logins expire in 12 hours
-                    browser.set_auth_level(Browser.L_STRONG_SKIPPED)
-                    browser.set_auth_state(Browser.S_AUTHENTICATED)
+                    browser.transition(Browser.L_STRONG_SKIPPED, Browser.S_AUTHENTICATED)
                     custom_log(request, "1f: Redirecting back to SSO service", level="info")
                     return redir_to_sso(request)
 
@@ -275,13 +248,11 @@ def authenticate_with_password(request):
                 if browser.get_auth_state() == Browser.S_REQUEST_BASIC_ONLY:
                     # Only basic authentication is required.
                     custom_log(request, "1f: only basic authentication was required. Upgrade directly to L_STRONG and S_AUTHENTICATED")
-                    browser.set_auth_level(Browser.L_STRONG)
-                    browser.set_auth_state(Browser.S_AUTHENTICATED)
+                    browser.transition(Browser.L_STRONG, Browser.S_AUTHENTICATED)
                 else:
                     # Continue to strong authentication
                     custom_log(request, "1f: set L_BASIC and S_REQUEST_STRONG")
-                    browser.set_auth_level(Browser.L_BASIC)
-                    browser.set_auth_state(Browser.S_REQUEST_STRONG)
+                    browser.transition(Browser.L_BASIC, Browser.S_REQUEST_STRONG)
 
                 return redirect_with_get_params("login_frontend.authentication_views.secondstepauth", request.GET)
             else:
@@ -414,8 +385,7 @@ def authenticate_with_url(request, **kwargs):
     # - user is authenticated
     # set authentication state and redirect through secondstepauth.
     # TODO: determine these automatically
-    request.browser.set_auth_level(Browser.L_STRONG)
-    request.browser.set_auth_state(Browser.S_AUTHENTICATED)
+    request.browser.transition(Browser.L_STRONG, Browser.S_AUTHENTICATED)
     sid_cleanup(sid)
     request.browser.revoke_sms()
     custom_log(request, "2f-url: Successfully authenticated with URL. Redirecting to secondstepauth", level="info")
@@ -464,10 +434,7 @@ def authenticate_with_authenticator(request):
             add_user_log(request, "Skipped strong authentication: %s left" % user.strong_skips_available, "meh-o")
             custom_log(request, "2f-auth: Skipped strong authentication: %s left" % user.strong_skips_available)
             # TODO: determine the levels automatically.
-            request.browser.set_auth_level(Browser.L_STRONG_SKIPPED)
-            request.browser.set_auth_state(Browser.S_AUTHENTICATED)
-            request.browser.set_auth_level_valid_until = timezone.now() + datetime.timedelta(hours=12)
-            request.browser.save()
+            request.browser.transition(Browser.L_STRONG_SKIPPED, Browser.S_AUTHENTICATED)
             custom_log(request, "2f-auth: Redirecting back to SSO provider", level="debug")
             return redir_to_sso(request)
         else:
@@ -529,9 +496,7 @@ def authenticate_with_authenticator(request):
 
 
                 # TODO: determine the levels automatically.
-                request.browser.set_auth_level(Browser.L_STRONG)
-                request.browser.set_auth_state(Browser.S_AUTHENTICATED)
-                request.browser.auth_state_changed()
+                request.browser.transition(Browser.L_STRONG, Browser.S_AUTHENTICATED)
                 custom_log(request, "2f-auth: Redirecting back to SSO provider", level="debug")
                 return redir_to_sso(request)
             else:
@@ -592,11 +557,7 @@ def authenticate_with_sms(request):
             add_user_log(request, "Skipped strong authentication: %s left" % user.strong_skips_available, "meh-o")
             custom_log(request, "2f-sms: Skipped strong authentication: %s left" % user.strong_skips_available)
             # TODO: determine the levels automatically.
-            request.browser.set_auth_level(Browser.L_STRONG)
-            request.browser.set_auth_state(Browser.S_AUTHENTICATED)
-            request.browser.set_auth_level_valid_until = timezone.now() + datetime.timedelta(hours=12)
-            request.browser.save()
-            request.browser.auth_state_changed()
+            request.browser.transition(Browser.L_STRONG, Browser.S_AUTHENTICATED)
             custom_log(request, "2f-sms: Redirecting back to SSO provider", level="debug")
             return redir_to_sso(request)
         else:
@@ -660,8 +621,8 @@ def authenticate_with_sms(request):
                 custom_log(request, "2f-sms: Second-factor authentication with SMS succeeded")
                 add_user_log(request, "Second-factor authentication with SMS succeeded", "lock")
                 # TODO: determine the levels automatically.
-                request.browser.set_auth_level(Browser.L_STRONG)
-                request.browser.set_auth_state(Browser.S_AUTHENTICATED)
+                # auth_state_changed is called below, only when redirecting back to SSO service.
+                request.browser.transition(Browser.L_STRONG, Browser.S_AUTHENTICATED, notify=False)
                 if user.primary_phone_changed:
                     user.primary_phone_changed = False
                     user.save()
@@ -697,18 +658,25 @@ def authenticate_with_sms(request):
     if not request.browser.valid_sms_exists(180) or request.POST.get("regen_sms"):
         custom_log(request, "2f-sms: Generating a new SMS code", level="info")
         sms_text = request.browser.generate_sms_text(request=request)
-        for phone in (user.primary_phone, user.secondary_phone):
-            if phone:
-                status = send_sms(phone, sms_text)
-                if not status:
-                    messages.warning(request, "Sending SMS to %s failed." % phone)
-                    custom_log(request, "2f-sms: Sending SMS to %s failed" % phone, level="warn")
-                    add_user_log(request, "Sending SMS to %s failed" % phone)
-                else:
-                    custom_log(request, "2f-sms: Sent OTP to %s" % phone)
-                    add_user_log(request, "Sent OTP code to %s" % phone, "info")
-                    phone_redacted = "%s...%s" % (phone[0:6], phone[-4:])
-                    messages.info(request, mark_safe("Sent SMS to <span class='tooltip-link' title='This is redacted to protect your privacy'>%s</span>" % phone_redacted))
+        if settings.SMS_QUEUE_ENABLED:
+            phones = [phone for phone in (user.primary_phone, user.secondary_phone) if phone]
+            queue_sms(request.browser, phones, sms_text)
+            for phone in phones:
+                custom_log(request, "2f-sms: Queued OTP to %s" % phone)
+                messages.info(request, mark_safe("Sending SMS to <span class='tooltip-link' title='This is redacted to protect your privacy'>%s</span>" % redact_phone(phone)))
+        else:
+            for phone in (user.primary_phone, user.secondary_phone):
+                if phone:
+                    status = send_sms(phone, sms_text)
+                    if not status:
+                        messages.warning(request, "Sending SMS to %s failed." % phone)
+                        custom_log(request, "2f-sms: Sending SMS to %s failed" % phone, level="warn")
+                        add_user_log(request, "Sending SMS to %s failed" % phone)
+                    else:
+                        custom_log(request, "2f-sms: Sent OTP to %s" % phone)
+                        add_user_log(request, "Sent OTP code to %s" % phone, "info")
+                        phone_redacted = "%s...%s" % (phone[0:6], phone[-4:])
+                        messages.info(request, mark_safe("Sent SMS to <span class='tooltip-link' title='This is redacted to protect your privacy'>%s</span>" % phone_redacted))
         if request.method == "POST":
             # Redirect to avoid duplicate SMSes on reload.
             return redirect_with_get_params("login_frontend.authentication_views.authenticate_with_sms", request.GET)
@@ -718,11 +686,24 @@ def authenticate_with_sms(request):
     ret["get_params"] = urllib.urlencode(request.GET)
     ret["my_computer"] = request.browser.save_browser
     ret["should_timesync"] = request.browser.should_timesync()
+    if settings.SMS_QUEUE_ENABLED:
+        ret["sms_status"] = sorted(get_sms_status(request.browser).items())
 
     response = render_to_response("login_frontend/authenticate_with_sms.html", ret, context_instance=RequestContext(request))
     return response
 
 
+@require_http_methods(["GET"])
+@ratelimit(rate='80/5s', ratekey="2s", block=True, method=["POST", "GET"])
+@ratelimit(rate='300/1m', ratekey="1m", block=True, method=["POST", "GET"])
+@ratelimit(rate='5000/6h', ratekey="6h", block=True, method=["POST", "GET"])
+@protect_view("authenticate_with_sms_status", required_level=Browser.L_BASIC)
+def authenticate_with_sms_status(request):
+    """ Returns delivery status for the latest SMS code, for polling """
+    ret = {"sms_id": request.browser.sms_code_id, "status": get_sms_status(request.browser)}
+    return HttpResponse(json.dumps(ret), content_type="application/json")
+
+
 @require_http_methods(["GET", "POST"])
 @ratelimit(rate='80/5s', ratekey="2s", block=True, method=["POST", "GET"])
 @ratelimit(rate='300/1m', ratekey="1m", block=True, method=["POST", "GET"])
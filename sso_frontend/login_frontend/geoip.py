@@ -0,0 +1,194 @@
+"""
+GeoIP lookups.
+
+Private networks from settings.IP_NETWORKS are matched with a binary prefix
+trie, built once per process. Both IPv4 and IPv6 addresses and networks are
+supported. Location strings are cached in a bounded in-process LRU cache.
+
+GeoIP database is memory-mapped, so all worker processes share the same
+pages. When the file is replaced, new database is opened and taken into use
+without restart.
+"""
+
+from django.conf import settings
+from login_frontend.lru_cache import LRUCache
+import geoip2.database
+import ipaddr
+import logging
+import maxminddb
+import os
+import threading
+import time
+from django_statsd.clients import statsd as sd
+
+__all__ = ["GeoIPReader", "NetworkTrie", "is_private_net", "get_geoip_string"]
+
+log = logging.getLogger(__name__)
+
+try:
+    import maxminddb.extension
+    GEOIP_MODE = maxminddb.MODE_MMAP_EXT # libmaxminddb, also memory-mapped
+except ImportError:
+    GEOIP_MODE = maxminddb.MODE_MMAP
+
+
+class GeoIPReader(object):
+    """ Memory-mapped geoip2 reader. Reopens the database if its mtime
+    changes. Checked at most every settings.GEOIP_RELOAD_CHECK_INTERVAL
+    seconds. """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.reader = None
+        self.mtime = None
+        self.checked_at = 0
+
+    def open(self, mtime):
+        start_time = time.time()
+        reader = geoip2.database.Reader(self.filename, mode=GEOIP_MODE)
+        sd.timing("login_frontend.geoip.reader.open", int((time.time() - start_time) * 1000))
+        # Readers in use by other threads are closed when garbage collected.
+        (self.reader, self.mtime) = (reader, mtime)
+        _cache.clear()
+
+    def get(self):
+        """ Returns current geoip2 reader """
+        now = time.time()
+        if self.reader is not None and now - self.checked_at < settings.GEOIP_RELOAD_CHECK_INTERVAL:
+            return self.reader
+        with self.lock:
+            if self.reader is not None and now - self.checked_at < settings.GEOIP_RELOAD_CHECK_INTERVAL:
+                return self.reader
+            self.checked_at = now
+            try:
+                mtime = os.stat(self.filename).st_mtime
+                if mtime != self.mtime:
+                    if self.reader is not None:
+                        log.info("GeoIP database %s changed. Reloading.", self.filename)
+                        sd.incr("login_frontend.geoip.reader.reload", 1)
+                    self.open(mtime)
+            except (IOError, OSError, ValueError, maxminddb.InvalidDatabaseError), e:
+                # For example, file is being written. Old reader is used until the next check.
+                log.error("Opening GeoIP database %s failed: %s", self.filename, e)
+                sd.incr("login_frontend.geoip.reader.reload_failed", 1)
+                if self.reader is None:
+                    raise
+            return self.reader
+
+    @sd.timer("login_frontend.geoip.reader.city")
+    def city(self, ip_address):
+        return self.get().city(ip_address)
+
+geo = GeoIPReader(settings.GEOIP_DB)
+
+
+class _Node(object):
+    __slots__ = ("children", "value")
+
+    def __init__(self):
+        self.children = [None, None]
+        self.value = None
+
+
+class NetworkTrie(object):
+    """ Maps IP networks to values. If an address is in several networks,
+    the value of the network added first is returned. """
+
+    def __init__(self):
+        self.roots = {4: _Node(), 6: _Node()}
+        self.count = 0
+
+    def add(self, network, value):
+        """ Adds ipaddr network or address """
+        network = ipaddr.IPNetwork(str(network))
+        max_bits = network.max_prefixlen
+        bits = int(network.network)
+        node = self.roots[network.version]
+        for i in range(network.prefixlen):
+            bit = (bits >> (max_bits - 1 - i)) & 1
+            if node.children[bit] is None:
+                node.children[bit] = _Node()
+            node = node.children[bit]
+        if node.value is None:
+            node.value = (self.count, value)
+        self.count += 1
+
+    def lookup(self, address):
+        """ Returns value for ipaddr address, or None """
+        max_bits = address.max_prefixlen
+        bits = int(address)
+        node = self.roots[address.version]
+        best = node.value
+        for i in range(max_bits):
+            node = node.children[(bits >> (max_bits - 1 - i)) & 1]
+            if node is None:
+                break
+            if node.value is not None and (best is None or node.value[0] < best[0]):
+                best = node.value
+        if best is None:
+            return None
+        return best[1]
+
+
+def _build_trie(networks):
+    trie = NetworkTrie()
+    for (network, _, _, description) in networks:
+        trie.add(network, description)
+    return trie
+
+_private_networks = _build_trie(settings.IP_NETWORKS)
+_cache = LRUCache(settings.GEOIP_CACHE_SIZE)
+
+
+def _parse_address(ip_address):
+    """ Returns ipaddr address, or None. IPv4-mapped IPv6 addresses are
+    returned as IPv4 addresses. """
+    try:
+        address = ipaddr.IPAddress(ip_address)
+    except ValueError:
+        return None
+    if address.version == 6 and getattr(address, "ipv4_mapped", None):
+        return address.ipv4_mapped
+    return address
+
+
+@sd.timer("login_frontend.geoip.is_private_net")
+def is_private_net(ip_address):
+    """ Returns description of private network (from settings.IP_NETWORKS)
+    ip_address belongs to, or False """
+    address = _parse_address(ip_address)
+    if address is None:
+        return False
+    return _private_networks.lookup(address) or False
+
+
+def _lookup(ip_address):
+    address = _parse_address(ip_address)
+    if address is None:
+        return "Unknown"
+    private_net = _private_networks.lookup(address)
+    if private_net:
+        return private_net
+    try:
+        data = geo.city(str(address))
+    except:
+        return "Unknown"
+    country = data.country.iso_code
+    city = data.city.name
+    if city is None:
+        return "%s" % country
+    return "%s (%s)" % (country, city)
+
+
+@sd.timer("login_frontend.geoip.get_geoip_string")
+def get_geoip_string(ip_address):
+    """ Returns short location string for IP address. """
+    result = _cache.get(ip_address)
+    if result is None:
+        sd.incr("login_frontend.geoip.get_geoip_string.cache_miss", 1)
+        result = _lookup(ip_address)
+        _cache.set(ip_address, result)
+    else:
+        sd.incr("login_frontend.geoip.get_geoip_string.cache_hit", 1)
+    return result
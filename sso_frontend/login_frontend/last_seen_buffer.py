@@ -0,0 +1,205 @@
+"""
+Write-behind buffer for BrowserUsers last seen information.
+
+Requests record the latest (timestamp, remote IP) for each user/browser pair
+to a redis hash. Repeated requests overwrite the same field, so updates are
+coalesced. flush_last_seen writes buffered values to BrowserUsers with bulk
+UPDATE ... CASE statements. It is executed periodically by huey (see tasks.py),
+and scheduled immediately if the buffer is older than
+settings.BROWSER_USERS_BUFFER_MAX_AGE.
+"""
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from login_frontend.models import BrowserUsers
+import datetime
+import logging
+import redis
+import time
+import uuid
+from django_statsd.clients import statsd as sd
+
+log = logging.getLogger(__name__)
+
+r = redis.Redis()
+
+BUFFER_KEY = "browserusers-last-seen"
+BUFFER_FLUSH_KEY = "browserusers-last-seen-flushing"
+BUFFER_SINCE_KEY = "browserusers-last-seen-since"
+BUFFER_SCHEDULED_KEY = "browserusers-last-seen-scheduled"
+BUFFER_LOCK_KEY = "browserusers-last-seen-lock"
+BUFFER_LOCK_TIMEOUT = 600 # seconds. Lock is released if flushing process dies.
+
+# (remote IP field, timestamp field) for active and passive (/ping) access
+FIELDS = {
+    "active": ("remote_ip", "last_seen"),
+    "passive": ("remote_ip_passive", "last_seen_passive"),
+}
+
+__all__ = ["record_last_seen", "buffered_last_seen", "flush_last_seen"]
+
+
+def buffer_field(kind, bid, username):
+    """ Returns redis hash field for single user/browser pair """
+    return "%s|%s|%s" % (kind, bid, username)
+
+
+def parse_value(value):
+    """ Returns (timestamp, remote_ip) from buffered value """
+    (timestamp, remote_ip) = value.split("|", 1)
+    timestamp = datetime.datetime.utcfromtimestamp(float(timestamp)).replace(tzinfo=timezone.utc)
+    return (timestamp, remote_ip)
+
+
+@sd.timer("login_frontend.last_seen_buffer.record_last_seen")
+def record_last_seen(browser, remote_ip, passive=False):
+    """ Records last seen timestamp and remote IP for browser.user """
+    kind = "passive" if passive else "active"
+    now = time.time()
+    pipe = r.pipeline()
+    pipe.hset(BUFFER_KEY, buffer_field(kind, browser.bid, browser.user.username), "%s|%s" % (now, remote_ip))
+    pipe.setnx(BUFFER_SINCE_KEY, now)
+    pipe.get(BUFFER_SINCE_KEY)
+    (_, _, since) = pipe.execute()
+    sd.incr("login_frontend.last_seen_buffer.recorded", 1)
+
+    if since and now - float(since) > settings.BROWSER_USERS_BUFFER_MAX_AGE:
+        # Periodic flush is late. Schedule it only once.
+        if r.setnx(BUFFER_SCHEDULED_KEY, now):
+            r.expire(BUFFER_SCHEDULED_KEY, settings.BROWSER_USERS_BUFFER_MAX_AGE)
+            sd.incr("login_frontend.last_seen_buffer.scheduled_flush", 1)
+            from login_frontend.tasks import flush_browser_users_last_seen
+            flush_browser_users_last_seen()
+
+
+@sd.timer("login_frontend.last_seen_buffer.buffered_last_seen")
+def buffered_last_seen(browser_users):
+    """ Updates BrowserUsers objects with buffered values that are not
+    written to database yet. Objects are not saved. """
+    if not settings.BROWSER_USERS_BUFFER_ENABLED or not browser_users:
+        return browser_users
+    fields = []
+    for item in browser_users:
+        for kind in ("active", "passive"):
+            fields.append((item, kind, buffer_field(kind, item.browser_id, item.user_id)))
+    pipe = r.pipeline()
+    pipe.hmget(BUFFER_KEY, [field for (_, _, field) in fields])
+    pipe.hmget(BUFFER_FLUSH_KEY, [field for (_, _, field) in fields])
+    (pending, flushing) = pipe.execute()
+
+    for i, (item, kind, _) in enumerate(fields):
+        value = pending[i] or flushing[i]
+        if not value:
+            continue
+        (timestamp, remote_ip) = parse_value(value)
+        (ip_field, timestamp_field) = FIELDS[kind]
+        if getattr(item, timestamp_field) is None or getattr(item, timestamp_field) < timestamp:
+            setattr(item, ip_field, remote_ip)
+            setattr(item, timestamp_field, timestamp)
+    return browser_users
+
+
+def update_batch(batch):
+    """ Writes single batch of {(bid, username): {kind: (timestamp, remote_ip)}}
+    with one UPDATE statement. Missing BrowserUsers rows are created. """
+    existing = {}
+    for (row_id, username, bid) in BrowserUsers.objects.filter(browser_id__in=set([bid for (bid, _) in batch])).values_list("id", "user_id", "browser_id"):
+        existing[(bid, username)] = row_id
+
+    missing = [key for key in batch if key not in existing]
+    if missing:
+        BrowserUsers.objects.bulk_create([BrowserUsers(browser_id=bid, user_id=username) for (bid, username) in missing])
+        for (row_id, username, bid) in BrowserUsers.objects.filter(browser_id__in=set([bid for (bid, _) in missing])).values_list("id", "user_id", "browser_id"):
+            existing.setdefault((bid, username), row_id)
+
+    set_clauses = []
+    params = []
+
+    def add_clause(column, values):
+        """ values is a list of (row id, new value) """
+        if not values:
+            return
+        set_clauses.append("%s = CASE id %s ELSE %s END" % (column, " ".join(["WHEN %s THEN %s"] * len(values)), column))
+        for (row_id, value) in values:
+            params.extend([row_id, value])
+
+    for kind, (ip_field, timestamp_field) in FIELDS.items():
+        rows = [(existing[key], values[kind]) for key, values in batch.items() if kind in values and key in existing]
+        add_clause(ip_field, [(row_id, remote_ip) for (row_id, (_, remote_ip)) in rows])
+        add_clause(timestamp_field, [(row_id, connection.ops.value_to_db_datetime(timestamp)) for (row_id, (timestamp, _)) in rows])
+
+    row_ids = [existing[key] for key in batch if key in existing]
+    if not set_clauses or not row_ids:
+        return 0
+    sql = "UPDATE %s SET %s WHERE id IN (%s)" % (BrowserUsers._meta.db_table, ", ".join(set_clauses), ", ".join(["%s"] * len(row_ids)))
+    cursor = connection.cursor()
+    cursor.execute(sql, params + row_ids)
+    return len(row_ids)
+
+
+def write_flushing():
+    """ Writes entries from BUFFER_FLUSH_KEY to database, and removes the
+    key. Returns number of updated rows. """
+    entries = {}
+    for field, value in r.hgetall(BUFFER_FLUSH_KEY).items():
+        try:
+            (kind, bid, username) = field.split("|", 2)
+            entries.setdefault((bid, username), {})[kind] = parse_value(value)
+        except ValueError:
+            log.error("Invalid last seen buffer entry: %s=%s", field, value)
+
+    keys = entries.keys()
+    batch_size = settings.BROWSER_USERS_BUFFER_BATCH_SIZE
+    updated = 0
+    for i in range(0, len(keys), batch_size):
+        batch = dict([(key, entries[key]) for key in keys[i:i + batch_size]])
+        with transaction.atomic():
+            updated += update_batch(batch)
+    r.delete(BUFFER_FLUSH_KEY)
+    return updated
+
+
+def release_lock(token):
+    """ Removes flush lock, if it is still held with token """
+    with r.pipeline() as pipe:
+        try:
+            pipe.watch(BUFFER_LOCK_KEY)
+            if pipe.get(BUFFER_LOCK_KEY) == token:
+                pipe.multi()
+                pipe.delete(BUFFER_LOCK_KEY)
+                pipe.execute()
+        except redis.WatchError:
+            pass
+
+
+@sd.timer("login_frontend.last_seen_buffer.flush_last_seen")
+def flush_last_seen():
+    """ Writes all buffered values to database. Returns number of updated rows.
+
+    Only one flush runs at a time. If an earlier flush failed, its entries
+    are written first. """
+    token = uuid.uuid4().hex
+    if not r.set(BUFFER_LOCK_KEY, token, nx=True, ex=BUFFER_LOCK_TIMEOUT):
+        sd.incr("login_frontend.last_seen_buffer.flush_locked", 1)
+        return 0
+    try:
+        updated = 0
+        if r.exists(BUFFER_FLUSH_KEY):
+            log.warning("Writing last seen information left behind by earlier flush")
+            updated += write_flushing()
+
+        try:
+            renamed = r.renamenx(BUFFER_KEY, BUFFER_FLUSH_KEY)
+        except redis.ResponseError:
+            # Buffer is empty
+            renamed = False
+        r.delete(BUFFER_SINCE_KEY, BUFFER_SCHEDULED_KEY)
+        if renamed:
+            updated += write_flushing()
+    finally:
+        release_lock(token)
+    if updated:
+        sd.incr("login_frontend.last_seen_buffer.flushed", updated)
+        log.info("Flushed last seen information for %s user/browser pairs", updated)
+    return updated
@@ -1,23 +1,140 @@
 """ LDAP authentication module """
 import ldap
+import ldap.dn
+import ldap.filter
 import logging
+import redis
+import threading
+import time
 from django.conf import settings
 from django_statsd.clients import statsd as sd
 from django.core.cache import get_cache
 
 ucache = get_cache("user_mapping")
+dcache = get_cache("default")
+redis_instance = redis.Redis()
 
-__all__ = ["LdapLogin"]
+__all__ = ["LdapLogin", "LdapConnectionPool", "refresh_group_memberships"]
+
+GROUPS_CACHE_KEY = "ldap-groups-%s"
+GROUPS_ACTIVE_KEY = "ldap-groups-active-users"
 
 log = logging.getLogger(__name__)
 
+class LdapConnectionPool: # pragma: no cover
+    """ Thread-safe pool of persistent LDAP connections.
+
+    Connections are rebound with user credentials on each use, so
+    TLS handshake is done only once per connection. Connections idle for
+    more than settings.LDAP_POOL_CHECK_INTERVAL seconds are checked
+    before use. """
+
+    def __init__(self, size):
+        self.size = size
+        self.lock = threading.Lock()
+        self.semaphore = threading.BoundedSemaphore(size)
+        self.idle = [] # list of (connection, last used timestamp)
+        self.in_use = 0
+
+    def report(self):
+        sd.gauge("login_frontend.ldap_auth.pool.in_use", self.in_use)
+        sd.gauge("login_frontend.ldap_auth.pool.idle", len(self.idle))
+
+    @sd.timer("login_frontend.ldap_auth.pool.connect")
+    def connect(self):
+        """ Opens a new LDAP connection """
+        if settings.LDAP_IGNORE_SSL:
+            log.debug("Ignoring LDAP SSL certificate checks")
+            ldap.set_option(ldap.OPT_X_TLS_REQUIRE_CERT, ldap.OPT_X_TLS_NEVER)
+        try:
+            connection = ldap.initialize(settings.LDAP_SERVER)
+        except ldap.SERVER_DOWN, e:
+            raise e
+        except:
+            raise Exception("Unknown error while connecting to LDAP server")
+        sd.incr("login_frontend.ldap_auth.pool.new_connection", 1)
+        return connection
+
+    def is_healthy(self, connection):
+        try:
+            connection.whoami_s()
+            return True
+        except ldap.LDAPError, e:
+            log.info("Discarding pooled LDAP connection: %s", e)
+            sd.incr("login_frontend.ldap_auth.pool.health_check_failed", 1)
+            return False
+
+    def discard(self, connection):
+        try:
+            connection.unbind_s()
+        except ldap.LDAPError:
+            pass
+
+    def acquire(self):
+        """ Returns connection from the pool, or opens a new one. Blocks if
+        all connections are in use. """
+        self.semaphore.acquire()
+        with self.lock:
+            self.in_use += 1
+        try:
+            while True:
+                with self.lock:
+                    if not self.idle:
+                        break
+                    (connection, last_used) = self.idle.pop()
+                if time.time() - last_used < settings.LDAP_POOL_CHECK_INTERVAL or self.is_healthy(connection):
+                    return connection
+                self.discard(connection)
+            return self.connect()
+        except:
+            self.release(None)
+            raise
+        finally:
+            self.report()
+
+    def release(self, connection, discard=False):
+        """ Returns connection to the pool. If discard is set, connection is closed. """
+        with self.lock:
+            self.in_use -= 1
+            if connection is not None and not discard:
+                self.idle.append((connection, time.time()))
+        if connection is not None and discard:
+            self.discard(connection)
+        self.semaphore.release()
+        self.report()
+
+    def run(self, func):
+        """ Runs func(connection) with pooled connection. If LDAP server
+        is down, retries once with a new connection. """
+        for attempt in range(2):
+            connection = self.acquire()
+            try:
+                ret = func(connection)
+            except ldap.SERVER_DOWN:
+                self.release(connection, discard=True)
+                if attempt > 0:
+                    raise
+                sd.incr("login_frontend.ldap_auth.pool.reconnect", 1)
+                log.info("Pooled LDAP connection is down. Reconnecting.")
+                continue
+            except (ldap.INVALID_CREDENTIALS, ldap.NO_SUCH_OBJECT):
+                # Failed bind leaves connection usable (anonymous).
+                self.release(connection)
+                raise
+            except:
+                self.release(connection, discard=True)
+                raise
+            self.release(connection)
+            return ret
+
+pool = LdapConnectionPool(settings.LDAP_POOL_SIZE)
+
 class LdapLogin: # pragma: no cover
     """ LDAP authentication module """
 
     def __init__(self, username, password):
         self.username = self.map_username(username)
         self.password = password
-        self._ldap = None
         self.user_dn = settings.LDAP_USER_BASE_DN % self.username
         self.authenticated = False
 
@@ -30,27 +147,11 @@ class LdapLogin: # pragma: no cover
             return username_tmp
         return username
 
-    @property
-    @sd.timer("login_frontend.ldap_auth.ldap")
-    def ldap(self):
-        """ Opens LDAP connection or returns cached connection, if available """
-        if self._ldap is None:
-            try:
-                self._ldap = ldap.initialize(settings.LDAP_SERVER)
-                if settings.LDAP_IGNORE_SSL:
-                    log.debug("Ignoring LDAP SSL certificate checks")
-                    ldap.set_option(ldap.OPT_X_TLS_REQUIRE_CERT, ldap.OPT_X_TLS_NEVER)
-            except ldap.SERVER_DOWN, e:
-                raise e
-            except:
-                raise Exception("Unknown error while connecting to LDAP server")
-        return self._ldap
-
     @sd.timer("login_frontend.ldap_auth.login")
     def login(self):
         """ Tries to login with provided user credentials """
         try:
-            self.ldap.simple_bind_s(self.user_dn, self.password)
+            pool.run(lambda connection: connection.simple_bind_s(self.user_dn, self.password))
         except ldap.INVALID_CREDENTIALS, e:
             return "invalid_credentials"
         except ldap.NO_SUCH_OBJECT, e:
@@ -70,13 +171,75 @@ class LdapLogin: # pragma: no cover
             self.login()
         if not self.authenticated:
             raise Exception("Unable to authenticate")
-        groups = self.ldap.search_s(settings.LDAP_GROUPS_BASE_DN, ldap.SCOPE_SUBTREE, "uniqueMember=%s" % self.user_dn, ["cn"])
+        redis_instance.zadd(GROUPS_ACTIVE_KEY, self.user_dn, time.time())
+        groups = dcache.get(GROUPS_CACHE_KEY % self.user_dn)
+        if groups is None:
+            sd.incr("login_frontend.ldap_auth.get_auth_tokens.cache_miss", 1)
+            groups = self.search_groups()
+            dcache.set(GROUPS_CACHE_KEY % self.user_dn, groups, settings.LDAP_GROUPS_CACHE_TIMEOUT)
+        else:
+            sd.incr("login_frontend.ldap_auth.get_auth_tokens.cache_hit", 1)
+        return [settings.TOKEN_MAP[group] for group in groups if group in settings.TOKEN_MAP]
 
-        tokens = []
-        for (_, attrs) in groups:
-            if "cn" not in attrs:
-                continue
-            if attrs["cn"][0] in settings.TOKEN_MAP:
-                tokens.append(settings.TOKEN_MAP[attrs["cn"][0]])
-        return tokens
+    @sd.timer("login_frontend.ldap_auth.search_groups")
+    def search_groups(self):
+        """ Returns list of group names (cn) for the user """
+        def search(connection):
+            # Pooled connection may be bound as another user.
+            connection.simple_bind_s(self.user_dn, self.password)
+            return connection.search_s(settings.LDAP_GROUPS_BASE_DN, ldap.SCOPE_SUBTREE, "uniqueMember=%s" % self.user_dn, ["cn"])
+        groups = pool.run(search)
+        return [attrs["cn"][0] for (_, attrs) in groups if "cn" in attrs]
+
+
+def normalize_dn(dn):
+    """ Returns comparable form of DN. Attribute types and values are
+    compared case-insensitively, and insignificant whitespace is ignored,
+    like uniqueMember matching on the server. """
+    try:
+        rdns = ldap.dn.str2dn(dn)
+    except ldap.DECODING_ERROR:
+        return dn.lower()
+    return tuple([tuple(sorted([(attr.lower(), " ".join(value.lower().split())) for (attr, value, _) in rdn])) for rdn in rdns])
+
+
+@sd.timer("login_frontend.ldap_auth.refresh_group_memberships")
+def refresh_group_memberships(): # pragma: no cover
+    """ Refreshes cached group memberships for users who logged in during
+    the last settings.LDAP_GROUPS_ACTIVE_WINDOW seconds.
+
+    Instead of one search per user, a single search fetches members of all
+    groups in settings.TOKEN_MAP. Requires settings.LDAP_BIND_DN. """
+    if not settings.LDAP_BIND_DN or not settings.TOKEN_MAP:
+        return 0
+    now = time.time()
+    redis_instance.zremrangebyscore(GROUPS_ACTIVE_KEY, 0, now - settings.LDAP_GROUPS_ACTIVE_WINDOW)
+    user_dns = redis_instance.zrangebyscore(GROUPS_ACTIVE_KEY, now - settings.LDAP_GROUPS_ACTIVE_WINDOW, now)
+    if not user_dns:
+        return 0
+
+    def search(connection):
+        connection.simple_bind_s(settings.LDAP_BIND_DN, settings.LDAP_BIND_PASSWORD)
+        search_filter = "(|%s)" % "".join(["(cn=%s)" % ldap.filter.escape_filter_chars(group) for group in settings.TOKEN_MAP])
+        return connection.search_s(settings.LDAP_GROUPS_BASE_DN, ldap.SCOPE_SUBTREE, search_filter, ["cn", "uniqueMember"])
+
+    user_dns = dict([(normalize_dn(user_dn), user_dn) for user_dn in user_dns])
+    memberships = dict([(user_dn, []) for user_dn in user_dns.values()])
+    for (_, attrs) in pool.run(search):
+        if "cn" not in attrs:
+            continue
+        for member in attrs.get("uniqueMember", []):
+            user_dn = user_dns.get(normalize_dn(member))
+            if user_dn is not None:
+                memberships[user_dn].append(attrs["cn"][0])
+
+    # No matching groups may also mean DN is written differently in the
+    # directory. Cached groups are removed, so that get_auth_tokens
+    # searches groups for the user, instead of caching an empty list.
+    not_found = [GROUPS_CACHE_KEY % user_dn for user_dn, groups in memberships.items() if not groups]
+    if not_found:
+        dcache.delete_many(not_found)
+    dcache.set_many(dict([(GROUPS_CACHE_KEY % user_dn, groups) for user_dn, groups in memberships.items() if groups]), settings.LDAP_GROUPS_CACHE_TIMEOUT)
+    sd.incr("login_frontend.ldap_auth.refresh_group_memberships.users", len(memberships))
+    return len(memberships)
 
@@ -0,0 +1,38 @@
+"""
+Bounded in-process cache.
+"""
+
+from collections import OrderedDict
+import threading
+
+__all__ = ["LRUCache"]
+
+
+class LRUCache(object):
+    """ Thread-safe dict with at most size entries. Least recently used
+    entry is removed first. """
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value = self.entries.pop(key)
+            except KeyError:
+                return default
+            self.entries[key] = value
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = value
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
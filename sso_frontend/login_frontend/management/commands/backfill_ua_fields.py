@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from login_frontend.models import Browser, BROWSER_CACHE_KEY, BROWSER_VERSION_KEY, invalidate_cached_row, parse_ua
+from optparse import make_option
+
+
+class Command(BaseCommand): # pragma: no cover
+    args = ''
+    help = 'Stores parsed user-agent fields for browsers that do not have them yet'
+
+    option_list = BaseCommand.option_list + (
+        make_option("--all", action="store_true", dest="all", default=False, help="Parse user-agents of all browsers again"),
+    )
+
+    def handle(self, *args, **options):
+        browsers = Browser.objects.all()
+        if not options["all"]:
+            browsers = browsers.filter(ua_device__isnull=True)
+        # Many browsers share the same user-agent. Each distinct user-agent
+        # is parsed once and updated with a single query.
+        uas = list(browsers.order_by().values_list("ua", flat=True).distinct())
+        updated = 0
+        for ua in uas:
+            ua_browsers = browsers.filter(ua=ua)
+            bids = list(ua_browsers.values_list("bid", flat=True))
+            updated += ua_browsers.update(**parse_ua(ua))
+            if settings.BROWSER_CACHE_ENABLED and bids:
+                # update() does not go through Browser.save
+                for bid in bids:
+                    invalidate_cached_row(BROWSER_CACHE_KEY % bid, BROWSER_VERSION_KEY % bid)
+        self.stdout.write("Updated %s browsers with %s distinct user-agents" % (updated, len(uas)))
@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from BeautifulSoup import BeautifulStoneSoup
+from saml2idp import codex
+from saml2idp.authn_request import parse_authn_request
+from optparse import make_option
+import time
+
+
+# Request layouts as sent by Google Apps (deflated) and Salesforce (plain base64).
+GOOGLE_APPS_REQUEST = """<?xml version="1.0" encoding="UTF-8"?>
+<samlp:AuthnRequest xmlns:samlp="urn:oasis:names:tc:SAML:2.0:protocol" ID="dhjnbhedpljnpegkmlngnkngjmfigdaocaoohiol" Version="2.0" IssueInstant="2014-03-20T10:10:10Z" ProtocolBinding="urn:oasis:names:tc:SAML:2.0:bindings:HTTP-POST" ProviderName="google.com" IsPassive="false" AssertionConsumerServiceURL="https://www.google.com/a/example.com/acs"><saml:Issuer xmlns:saml="urn:oasis:names:tc:SAML:2.0:assertion">google.com</saml:Issuer><samlp:NameIDPolicy AllowCreate="true" Format="urn:oasis:names:tc:SAML:1.1:nameid-format:unspecified" /></samlp:AuthnRequest>
+"""
+
+SALESFORCE_REQUEST = """<?xml version="1.0" encoding="UTF-8"?><samlp:AuthnRequest xmlns:samlp="urn:oasis:names:tc:SAML:2.0:protocol" AssertionConsumerServiceURL="https://example.my.salesforce.com?so=00D000000000001" Destination="https://login.example.com/idp/login/" ID="_2CAAAAUToq7NnME8wMDAwMDAwMDAwMDAwMDAwAAAA3l3SbPB4oWYL0C3iP4RWrwHzZBxZXJUrv0F3hnfYlamVStZrGiFk38eO9oEHQI9XX6r9RMdcrpPq86Hbxxw5BHZXnU98tWcZHOoOr7nCAyGPHt5ZjTt5h4ofdJ5Tb6YM-E2oyD_TOBUwTpoxMfCZdVmIU0Ob4CDkKLP6q8YSuppQPDD0e9gfNU58MXbWxDhGSd0ZHBXbK-a5AEaTFhAXabzx_sGyQb3QMVdlINKBcpKpDBPMGNPJzOkoNP5DeLqD5wkj46C1ZHKhgGuLMy7umA0gdXDEhV5oWHUG19HxWcD9ub1JqSJvUQ4ezptAwUHk0NwjE_m07hy4MGUHMI53S-iHLM8CaBZYWzHd_zSfJXULKTeFoC9h6hY6JNrvTEQLBPfQv3UkA9qXfBYEnJbWhWuhrVEAcmxzupkQzNLZ" IssueInstant="2014-03-20T10:10:10.000Z" ProtocolBinding="urn:oasis:names:tc:SAML:2.0:bindings:HTTP-POST" Version="2.0"><saml:Issuer xmlns:saml="urn:oasis:names:tc:SAML:2.0:assertion">https://saml.salesforce.com</saml:Issuer><ds:Signature xmlns:ds="http://www.w3.org/2000/09/xmldsig#"><ds:SignedInfo><ds:CanonicalizationMethod Algorithm="http://www.w3.org/2001/10/xml-exc-c14n#"/><ds:SignatureMethod Algorithm="http://www.w3.org/2000/09/xmldsig#rsa-sha1"/><ds:Reference URI="#_2CAAAAUToq7NnME8wMDAwMDAwMDAwMDAwMDAwAAAA3l3SbPB4oWYL0C3iP4RWrwHzZBxZXJUrv0F3hnfYlamVStZrGiFk38eO9oEHQI9XX6r9RMdcrpPq86Hbxxw5BHZXnU98tWcZHOoOr7nCAyGPHt5ZjTt5h4ofdJ5Tb6YM-E2oyD_TOBUwTpoxMfCZdVmIU0Ob4CDkKLP6q8YSuppQPDD0e9gfNU58MXbWxDhGSd0ZHBXbK-a5AEaTFhAXabzx_sGyQb3QMVdlINKBcpKpDBPMGNPJzOkoNP5DeLqD5wkj46C1ZHKhgGuLMy7umA0gdXDEhV5oWHUG19HxWcD9ub1JqSJvUQ4ezptAwUHk0NwjE_m07hy4MGUHMI53S-iHLM8CaBZYWzHd_zSfJXULKTeFoC9h6hY6JNrvTEQLBPfQv3UkA9qXfBYEnJbWhWuhrVEAcmxzupkQzNLZ"><ds:Transforms><ds:Transform Algorithm="http://www.w3.org/2000/09/xmldsig#enveloped-signature"/><ds:Transform Algorithm="http://www.w3.org/2001/10/xml-exc-c14n#"><ec:InclusiveNamespaces xmlns:ec="http://www.w3.org/2001/10/xml-exc-c14n#" PrefixList="ds saml samlp"/></ds:Transform></ds:Transforms><ds:DigestMethod Algorithm="http://www.w3.org/2000/09/xmldsig#sha1"/><ds:DigestValue>b3pQqGdQ3M1MC2K1bnHsk8wNJ0k=</ds:DigestValue></ds:Reference></ds:SignedInfo><ds:SignatureValue>NxbN4s4Tv6BZ6tPq7KrP4dCmlX1vCdo6XAsfPX0JMy7GIsX4h6Jbz8v5tq+QjWQZh9Q3gm1w0vCZkW2Zs+qG7Q1sJw9yMPhwlFCtqzK0g9sWtqGEdNRDTq3I5mUcWNU3VmTQJrhsWPmYIQx8VlPaBpz4pN2R4UaOGg1m4bZ3hHI=</ds:SignatureValue></ds:Signature></samlp:AuthnRequest>"""
+
+
+def soup_parse(request_xml):
+    """ Previous Processor._parse_request implementation """
+    soup = BeautifulStoneSoup(request_xml)
+    request = soup.findAll()[0]
+    params = {}
+    params['ACS_URL'] = request['assertionconsumerserviceurl']
+    params['REQUEST_ID'] = request['id']
+    params['DESTINATION'] = request.get('destination', '')
+    params['PROVIDER_NAME'] = request.get('providername', '')
+    return params
+
+
+class Command(BaseCommand): # pragma: no cover
+    args = '[file with SAMLRequest parameter ...]'
+    help = 'Benchmarks SAML AuthnRequest parsing. Optionally takes captured base64-encoded SAMLRequest values as files.'
+
+    option_list = BaseCommand.option_list + (
+        make_option("--iterations", type="int", dest="iterations", default=1000, help="Number of parses per request"),
+    )
+
+    def handle(self, *args, **options):
+        iterations = options["iterations"]
+        if iterations < 1:
+            raise CommandError("--iterations must be positive")
+
+        cases = [
+            ("Google Apps", codex.decode_base64_and_inflate(codex.deflate_and_base64_encode(GOOGLE_APPS_REQUEST))),
+            ("Salesforce", SALESFORCE_REQUEST),
+        ]
+        for filename in args:
+            saml_request = open(filename).read().strip()
+            try:
+                request_xml = codex.decode_base64_and_inflate(saml_request)
+            except Exception:
+                request_xml = saml_request.decode("base64")
+            cases.append((filename, request_xml))
+
+        for (name, request_xml) in cases:
+            if soup_parse(request_xml)["ACS_URL"] != parse_authn_request(request_xml)["ACS_URL"]:
+                self.stderr.write("%s: parsers returned different ACS URL" % name)
+
+            start_time = time.time()
+            for _ in range(iterations):
+                soup_parse(request_xml)
+            soup_time = (time.time() - start_time) / iterations
+
+            start_time = time.time()
+            for _ in range(iterations):
+                parse_authn_request(request_xml)
+            expat_time = (time.time() - start_time) / iterations
+
+            self.stdout.write("%-20s %6s bytes  BeautifulSoup: %8.3fms  expat: %8.3fms" % (name, len(request_xml), soup_time * 1000, expat_time * 1000))
@@ -0,0 +1,84 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from login_frontend.totp import TotpWindow, CURRENT_OFFSETS, DRIFT_OFFSETS, get_totp_code, is_totp_code
+from optparse import make_option
+import pyotp
+import time
+
+
+def legacy_validate(secret, old_secrets, code):
+    """ Previous User.validate_authenticator_code algorithm, without database and logging """
+    totp = pyotp.TOTP(secret)
+    for timestamp in [time.time() - 30, time.time(), time.time() + 30]:
+        if str(code) == get_totp_code(totp, timestamp):
+            return "valid"
+    for time_diff in range(-900, 900, 30):
+        if str(code) == get_totp_code(totp, time.time() + time_diff):
+            return "drift"
+    for old_secret in old_secrets:
+        totp = pyotp.TOTP(old_secret)
+        for time_diff in range(-900, 900, 30):
+            if str(code) == get_totp_code(totp, time.time() + time_diff):
+                return "old"
+    return "invalid"
+
+
+def window_validate(secret, old_secrets, code, max_old_secrets):
+    """ Current User.validate_authenticator_code algorithm, without database and logging """
+    if not is_totp_code(code):
+        return "invalid"
+    window = TotpWindow()
+    window.add(secret, CURRENT_OFFSETS)
+    if window.match(code):
+        return "valid"
+    window.add(secret, DRIFT_OFFSETS)
+    if window.match(code):
+        return "drift"
+    old_window = TotpWindow(window.timestamp)
+    for old_secret in old_secrets[:max_old_secrets]:
+        old_window.add(old_secret, DRIFT_OFFSETS)
+    if old_window.match(code):
+        return "old"
+    return "invalid"
+
+
+class Command(BaseCommand): # pragma: no cover
+    args = ''
+    help = 'Benchmarks Authenticator OTP validation'
+
+    option_list = BaseCommand.option_list + (
+        make_option("--iterations", type="int", dest="iterations", default=50, help="Number of validations per case"),
+        make_option("--old-secrets", type="int", dest="old_secrets", default=20, help="Number of old Authenticator configurations"),
+        make_option("--max-old-secrets", type="int", dest="max_old_secrets", default=10, help="Number of old configurations checked by the new algorithm"),
+    )
+
+    def handle(self, *args, **options):
+        iterations = options["iterations"]
+        if iterations < 1:
+            raise CommandError("--iterations must be positive")
+        secret = pyotp.random_base32()
+        old_secrets = [pyotp.random_base32() for _ in range(options["old_secrets"])]
+        totp = pyotp.TOTP(secret)
+        cases = [
+            ("valid code", get_totp_code(totp, time.time())),
+            ("clock drift", get_totp_code(totp, time.time() - 600)),
+            ("old configuration", get_totp_code(pyotp.TOTP(old_secrets[0]), time.time())) if old_secrets else None,
+            ("incorrect code", "000000"),
+            ("not a code", "password"),
+        ]
+
+        for case in cases:
+            if case is None:
+                continue
+            (name, code) = case
+            start_time = time.time()
+            for _ in range(iterations):
+                legacy_validate(secret, old_secrets, code)
+            legacy_time = (time.time() - start_time) / iterations
+
+            start_time = time.time()
+            for _ in range(iterations):
+                window_validate(secret, old_secrets, code, options["max_old_secrets"])
+            window_time = (time.time() - start_time) / iterations
+
+            self.stdout.write("%-20s legacy: %8.3fms  window: %8.3fms" % (name, legacy_time * 1000, window_time * 1000))
@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from login_frontend import ua_classifier
+from optparse import make_option
+import re
+import time
+
+
+CORPUS = [
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_2) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/34.0.1847.116 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10.9; rv:28.0) Gecko/20100101 Firefox/28.0",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_2) AppleWebKit/537.75.14 (KHTML, like Gecko) Version/7.0.3 Safari/537.75.14",
+    "Mozilla/5.0 (Windows NT 6.1; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/34.0.1847.116 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 6.3; WOW64; Trident/7.0; rv:11.0) like Gecko",
+    "Mozilla/5.0 (compatible; MSIE 10.0; Windows NT 6.2; WOW64; Trident/6.0)",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/34.0.1847.116 Safari/537.36",
+    "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:28.0) Gecko/20100101 Firefox/28.0",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 7_1 like Mac OS X) AppleWebKit/537.51.2 (KHTML, like Gecko) Version/7.0 Mobile/11D167 Safari/9537.53",
+    "Mozilla/5.0 (iPad; CPU OS 7_1 like Mac OS X) AppleWebKit/537.51.2 (KHTML, like Gecko) Version/7.0 Mobile/11D167 Safari/9537.53",
+    "Mozilla/5.0 (Linux; Android 4.4.2; Nexus 5 Build/KOT49H) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/34.0.1847.114 Mobile Safari/537.36",
+    "Mozilla/5.0 (Linux; Android 4.4.2; Nexus 7 Build/KOT49H) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/34.0.1847.114 Safari/537.36",
+    "Mozilla/5.0 (Android; Mobile; rv:28.0) Gecko/28.0 Firefox/28.0",
+    "Mozilla/5.0 (compatible; MSIE 10.0; Windows Phone 8.0; Trident/6.0; IEMobile/10.0; ARM; Touch; NOKIA; Lumia 920)",
+    "Mozilla/5.0 (BlackBerry; U; BlackBerry 9900; en) AppleWebKit/534.11+ (KHTML, like Gecko) Version/7.1.0.346 Mobile Safari/534.11+",
+    "Opera/9.80 (Android; Opera Mini/7.5.33361/31.1448; U; en) Presto/2.8.119 Version/11.1010",
+    "Mozilla/5.0 (X11; U; Linux armv7l; en-GB; rv:1.9.2.3pre) Gecko/20100723 Firefox/3.5 Maemo Browser 1.7.4.8 RX-51 N900",
+    "curl/7.30.0",
+    "Wget/1.14 (linux-gnu)",
+    "Pingdom.com_bot_version_1.4_(http://www.pingdom.com/)",
+]
+
+LEGACY_UA_DETECT = dict(ua_classifier.UA_ICONS)
+LEGACY_DISALLOWED_UA = [re.compile("^%s.*" % re.escape(prefix)) for prefix in ua_classifier.BOT_UA]
+
+
+def legacy_classify(ua):
+    """ Previous BrowserMiddleware and Browser.get_ua_icons implementation """
+    is_bot = False
+    for ua_re in LEGACY_DISALLOWED_UA:
+        if ua_re.match(ua):
+            is_bot = True
+            break
+    for (regex, icons) in LEGACY_UA_DETECT.iteritems():
+        if re.match(regex, ua):
+            return (icons, is_bot)
+    return (["question"], is_bot)
+
+
+class Command(BaseCommand): # pragma: no cover
+    args = '[file with one user-agent per line]'
+    help = 'Benchmarks user-agent classification'
+
+    option_list = BaseCommand.option_list + (
+        make_option("--iterations", type="int", dest="iterations", default=1000, help="Number of passes over the corpus"),
+    )
+
+    def handle(self, *args, **options):
+        iterations = options["iterations"]
+        if iterations < 1:
+            raise CommandError("--iterations must be positive")
+        corpus = list(CORPUS)
+        for filename in args:
+            corpus.extend([line.strip() for line in open(filename) if line.strip()])
+
+        def run(func):
+            start_time = time.time()
+            for _ in range(iterations):
+                for ua in corpus:
+                    func(ua)
+            return len(corpus) * iterations / (time.time() - start_time)
+
+        self.stdout.write("%s user-agents, %s passes" % (len(corpus), iterations))
+        self.stdout.write("%-30s %10.0f UAs/s" % ("legacy", run(legacy_classify)))
+        self.stdout.write("%-30s %10.0f UAs/s" % ("compiled, no cache", run(ua_classifier._classify)))
+        self.stdout.write("%-30s %10.0f UAs/s" % ("compiled, cached", run(ua_classifier.classify)))
@@ -4,7 +4,8 @@
 Middleware classes.
 
 BrowserMiddleware adds request.browser, and automatically signs user out,
-if browser was restarted, and not saved.
+if browser was restarted, and not saved. Browser is loaded only once per
+request; process_response reuses the instance resolved by process_request.
 
 Also, session cookie is automatically added if it does not exist yet.
 """
@@ -12,19 +13,22 @@ Also, session cookie is automatically added if it does not exist yet.
 from django.conf import settings
 from django.contrib import messages
 from django.core.exceptions import MiddlewareNotUsed
+from django.db.models.signals import post_save
 from django.http import HttpResponse
 from django.shortcuts import render_to_response
 from django.template import RequestContext
 from django.utils import timezone
-from login_frontend.models import Browser, BrowserUsers, BrowserLogin, create_browser_uuid, BrowserP0f
+from login_frontend.models import Browser, BrowserUsers, BrowserLogin, create_browser_uuid, BrowserP0f, get_cached_browser, sign_out_logins
+from login_frontend.last_seen_buffer import record_last_seen
 from login_frontend.providers import pubtkt_logout
+from login_frontend.ua_classifier import classify as classify_ua
 from login_frontend.utils import dedup_messages
 import datetime
 import logging
 import p0f
 import pytz
-import re
 import socket
+import threading
 import time
 from django_statsd.clients import statsd as sd
 from django.core.cache import get_cache
@@ -37,14 +41,20 @@ timing_log = logging.getLogger("request_timing")
 p0f_log = logging.getLogger("p0f")
 
 
-DISALLOWED_UA = [
- re.compile("^Wget/.*"),
- re.compile("^Pingdom.com_bot_version.*"),
- re.compile("^curl/.*"),
- re.compile("^nutch-.*"),
-]
+__all__ = ["get_browser", "BrowserMiddleware", "get_browser_instance", "resolve_browser", "P0fMiddleware"]
 
-__all__ = ["get_browser", "BrowserMiddleware", "get_browser_instance", "P0fMiddleware"]
+# Browser instances saved during the current request, keyed by bid.
+_resolved = threading.local()
+
+def browser_saved(sender, **kwargs):
+    """ Keeps track of the latest saved instance for each bid. Saved instance
+    always matches the database row, so it can be used without a query. """
+    saved = getattr(_resolved, "saved", None)
+    if saved is not None:
+        instance = kwargs.get("instance")
+        saved[instance.bid] = instance
+
+post_save.connect(browser_saved, sender=Browser)
 
 @sd.timer("get_browser_instance")
 def get_browser_instance(request):    
@@ -52,7 +62,7 @@ def get_browser_instance(request):
     if not bid:
         return None
     try:
-        browser = Browser.objects.select_related("user").get(bid=bid)
+        browser = get_cached_browser(bid)
         sd.incr("get_browser_instance.success", 1)
     except Browser.DoesNotExist:
         sd.incr("get_browser_instance.invalid", 1)
@@ -61,6 +71,30 @@ def get_browser_instance(request):
 
     return browser
 
+@sd.timer("resolve_browser")
+def resolve_browser(request):
+    """ Returns Browser for browser ID cookie without a second query.
+
+    If process_request already resolved the browser, that instance is used.
+    If any instance of the same browser was saved after that (for example,
+    logout, set_auth_level or rename on another Browser object), the latest
+    saved instance is returned instead, as it reflects the current state.
+    """
+    bid = request.COOKIES.get(Browser.C_BID)
+    if not bid:
+        return None
+    resolved = getattr(request, "_resolved_browser", None)
+    if resolved is None or resolved[0] != bid:
+        # process_request did not run for this request.
+        sd.incr("resolve_browser.database", 1)
+        return get_browser_instance(request)
+    saved = getattr(_resolved, "saved", None) or {}
+    if bid in saved:
+        sd.incr("resolve_browser.saved", 1)
+        return saved[bid]
+    sd.incr("resolve_browser.cached", 1)
+    return resolved[1]
+
 @sd.timer("get_browser")
 def get_browser(request):
     browser = get_browser_instance(request)
@@ -78,11 +112,9 @@ def get_browser(request):
     else:
         browser.valid_session_bid = False
         # Mark session based logins as signed_out
-        sessions = BrowserLogin.objects.filter(browser=browser).filter(expires_session=True).filter(signed_out=False)
-        for session in sessions:
-            log.info("Marking session %s for %s (user %s) as signed out, after browser session id cookie disappeared.", session.sso_provider, browser.bid, session.user.username)
-            session.signed_out = True
-            session.save()
+        signed_out = sign_out_logins(BrowserLogin.objects.filter(browser=browser).filter(expires_session=True))
+        if signed_out:
+            log.info("Marked sessions %s for %s as signed out, after browser session id cookie disappeared.", signed_out, browser.bid)
         if not browser.save_browser:
             # Browser was restarted, and save_browser is not set. Logout.
             log.info("Browser bid_public=%s was restarted. Logging out. path: %s", browser.bid_public, request.path)
@@ -95,16 +127,23 @@ def get_browser(request):
         last_update = dcache.get(r_k)
         remote_address = request.remote_ip
         if last_update != remote_address:
-            user_to_browser, _ = BrowserUsers.objects.get_or_create(user=browser.user, browser=browser)
-            if request.path.startswith("/ping"):
+            passive = request.path.startswith("/ping")
+            if passive:
                 sd.incr("get_browser.passive_access", 1)
-                user_to_browser.remote_ip_passive = remote_address
-                user_to_browser.last_seen_passive = timezone.now()
             else:
                 sd.incr("get_browser.active_access", 1)
-                user_to_browser.remote_ip = remote_address
-                user_to_browser.last_seen = timezone.now()
-            user_to_browser.save()
+            if settings.BROWSER_USERS_BUFFER_ENABLED:
+                # Coalesced and written to database by login_frontend.tasks
+                record_last_seen(browser, remote_address, passive)
+            else:
+                user_to_browser, _ = BrowserUsers.objects.get_or_create(user=browser.user, browser=browser)
+                if passive:
+                    user_to_browser.remote_ip_passive = remote_address
+                    user_to_browser.last_seen_passive = timezone.now()
+                else:
+                    user_to_browser.remote_ip = remote_address
+                    user_to_browser.last_seen = timezone.now()
+                user_to_browser.save()
             dcache.set(r_k, remote_address, 30)
     return browser
 
@@ -256,29 +295,36 @@ class BrowserMiddleware(object):
     def process_request(self, request):
         """ Adds request.browser. Filters out monitoring bots. """
         ua = request.META.get("HTTP_USER_AGENT") 
-        for ua_re in DISALLOWED_UA:
-            if ua_re.match(ua):
-                ret = {}
-                try:
-                    (_, ret["admin"]) = settings.ADMINS[0]
-                except (IndexError, ValueError):
-                    pass
-                return render_to_response("login_frontend/errors/you_are_a_bot.html", ret, context_instance=RequestContext(request))
+        if classify_ua(ua).is_bot:
+            ret = {}
+            try:
+                (_, ret["admin"]) = settings.ADMINS[0]
+            except (IndexError, ValueError):
+                pass
+            return render_to_response("login_frontend/errors/you_are_a_bot.html", ret, context_instance=RequestContext(request))
 
+        _resolved.saved = {}
         request.browser = get_browser(request)
+        request._resolved_browser = (request.COOKIES.get(Browser.C_BID), request.browser)
 
 
     @sd.timer("BrowserMiddleware.process_response")
     def process_response(self, request, response):
         """ Automatically adds session cookie if old one is not available. """
         response["Server"] = "https://github.com/ojarva/sso-frontend"
+        try:
+            return self._process_response(request, response)
+        finally:
+            _resolved.saved = None
+
+    def _process_response(self, request, response):
         if request.path.startswith("/csp-report") or request.path.startswith("/timesync"):
             log.debug("Browser from '%s' reporting CSP/timesync - skip process_response", request.remote_ip)
             sd.incr("login_frontend.middleware.BrowserMiddleware.process_response.skip", 1)
             return response
         
-        # Browser from process_request is not available here.
-        browser = get_browser_instance(request)
+        # request.browser might have been replaced by the view.
+        browser = resolve_browser(request)
 
         if not browser or browser.get_auth_level() < Browser.L_STRONG:
             response = pubtkt_logout(request, response)
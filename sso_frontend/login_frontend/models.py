@@ -3,19 +3,19 @@ from distutils.version import LooseVersion
 from django.conf import settings
 from django.contrib.auth import logout as django_logout
 from django.core.urlresolvers import reverse
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
+from login_frontend.request_log import request_logger
+from login_frontend.totp import is_totp_code, TotpWindow, CURRENT_OFFSETS, DRIFT_OFFSETS
+from login_frontend.ua_classifier import classify as classify_ua
 from random import choice, randint
 import datetime
 import httpagentparser
 import json
 import logging
 import pyotp
-import re
 import redis
 import subprocess
-import sys
-import os
 import time
 import urllib
 import uuid
@@ -27,38 +27,12 @@ dcache = get_cache("default")
 
 log = logging.getLogger(__name__)
 
-__all__ = ["create_browser_uuid", "EmergencyCodes", "EmergencyCode", "add_user_log", "Log", "Browser", "BrowserLogin", "BrowserUsers", "User", "AuthenticatorCode", "KeystrokeSequence", "BrowserDetails", "BrowserP0f", "BrowserTime", "UserService"]
+__all__ = ["create_browser_uuid", "get_cached_browser", "EmergencyCodes", "EmergencyCode", "add_user_log", "write_user_log", "write_queued_user_logs", "Log", "parse_ua", "Browser", "BrowserLogin", "sign_out_logins", "BrowserUsers", "User", "AuthenticatorCode", "KeystrokeSequence", "BrowserDetails", "BrowserP0f", "BrowserTime", "UserService"]
 
 redis_instance = redis.Redis()
 
 
-@sd.timer("login_frontend.models.custom_log")
-def custom_log(request, message, **kwargs):
-    """ Automatically logs username, remote IP and bid_public """
-    try:
-        raise Exception
-    except:
-        stack = sys.exc_info()[2].tb_frame.f_back
-    if stack is not None:
-        stack = stack.f_back
-    while hasattr(stack, "f_code"):
-        co = stack.f_code
-        filename = os.path.normcase(co.co_filename)
-        filename = co.co_filename
-        lineno = stack.f_lineno
-        co_name = co.co_name
-        break
-
-    level = kwargs.get("level", "info")
-    method = getattr(log, level)
-    remote_addr = request.remote_ip
-    bid_public = username = ""
-    if hasattr(request, "browser") and request.browser:
-        bid_public = request.browser.bid_public
-        if request.browser.user:
-            username = request.browser.user.username
-    method("[%s:%s:%s] %s - %s - %s - %s", filename, lineno, co_name,
-                            remote_addr, username, bid_public, message)
+custom_log = request_logger(log)
 
 
 def create_browser_uuid():
@@ -66,6 +40,76 @@ def create_browser_uuid():
     return str(uuid.uuid4())
 
 
+BROWSER_CACHE_KEY = "browser-row-%s"
+USER_CACHE_KEY = "user-row-%s"
+# Changed on every save. Snapshots are stored with the version that was
+# current before reading the row, so a snapshot read before a concurrent
+# save never replaces the newer state.
+BROWSER_VERSION_KEY = "browser-row-version-%s"
+USER_VERSION_KEY = "user-row-version-%s"
+
+def row_snapshot(instance):
+    """ Returns compact, picklable snapshot of model row. """
+    return tuple([getattr(instance, field.attname) for field in instance._meta.concrete_fields])
+
+def from_row_snapshot(model, snapshot):
+    """ Returns model instance from row_snapshot, or None if snapshot
+    is missing or does not match current model fields. """
+    if not isinstance(snapshot, tuple) or len(snapshot) != len(model._meta.concrete_fields):
+        return None
+    instance = model(*snapshot)
+    instance._state.adding = False
+    instance._state.db = "default"
+    return instance
+
+def get_cached_row(model, cache_key, version_key):
+    """ Returns (instance or None, current version) """
+    values = dcache.get_many([cache_key, version_key])
+    version = values.get(version_key)
+    cached = values.get(cache_key)
+    if not isinstance(cached, tuple) or len(cached) != 2 or cached[0] != version:
+        return (None, version)
+    return (from_row_snapshot(model, cached[1]), version)
+
+def set_cached_row(cache_key, instance, version):
+    """ Stores snapshot of instance, read after version was fetched """
+    dcache.set(cache_key, (version, row_snapshot(instance)), settings.BROWSER_CACHE_TIMEOUT)
+
+def invalidate_cached_row(cache_key, version_key):
+    """ Removes cached row, and ignores snapshots of earlier reads """
+    # Version must outlive snapshots written with the previous version.
+    dcache.set(version_key, uuid.uuid4().hex, settings.BROWSER_CACHE_TIMEOUT * 2)
+    dcache.delete(cache_key)
+
+@sd.timer("login_frontend.models.get_cached_browser")
+def get_cached_browser(bid):
+    """ Returns Browser with related User for bid. Raises Browser.DoesNotExist.
+
+    If settings.BROWSER_CACHE_ENABLED is set, rows are read through "default"
+    cache. Cached rows are invalidated by Browser.save and User.save.
+    """
+    if not settings.BROWSER_CACHE_ENABLED:
+        return Browser.objects.select_related("user").get(bid=bid)
+
+    (browser, version) = get_cached_row(Browser, BROWSER_CACHE_KEY % bid, BROWSER_VERSION_KEY % bid)
+    if browser is None:
+        sd.incr("login_frontend.models.get_cached_browser.miss", 1)
+        # User row is not cached here, as its version was not read before the query.
+        browser = Browser.objects.select_related("user").get(bid=bid)
+        set_cached_row(BROWSER_CACHE_KEY % bid, browser, version)
+        return browser
+
+    sd.incr("login_frontend.models.get_cached_browser.hit", 1)
+    if browser.user_id is not None:
+        (user, version) = get_cached_row(User, USER_CACHE_KEY % browser.user_id, USER_VERSION_KEY % browser.user_id)
+        if user is None:
+            sd.incr("login_frontend.models.get_cached_browser.user_miss", 1)
+            user = User.objects.get(username=browser.user_id)
+            set_cached_row(USER_CACHE_KEY % user.username, user, version)
+        browser.user = user
+    return browser
+
+
 class EmergencyCodes(models.Model):
     user = models.ForeignKey("User", primary_key=True)
     generated_at = models.DateTimeField(null=True)
@@ -125,6 +169,11 @@ class EmergencyCode(models.Model):
         unique_together = (("codegroup", "code_id"), ("codegroup", "code_val"))
 
 
+USER_LOG_QUEUE_KEY = "user-log-queue-%s"
+USER_LOG_QUEUE_USERS_KEY = "user-log-queue-users"
+USER_LOG_DEAD_LETTER_KEY = "user-log-dead-letter"
+USER_LOG_MAX_ATTEMPTS = 5 # Entries failing this many times are moved to USER_LOG_DEAD_LETTER_KEY
+
 @sd.timer("login_frontend.models.add_user_log")
 def add_user_log(request, message, status="question", **kwargs):
     if request.browser is None or request.browser.user is None:
@@ -132,12 +181,94 @@ def add_user_log(request, message, status="question", **kwargs):
     bid_public = kwargs.get("bid_public")
     if not bid_public:
         bid_public = request.browser.bid_public
-    Log.objects.create(user=request.browser.user, bid_public=bid_public, message=message, remote_ip=request.remote_ip, status=status)
+    write_user_log(request.browser.user_id, bid_public, message, request.remote_ip, status)
+
+def write_user_log(username, bid_public, message, remote_ip, status):
+    """ Adds user visible log entry. With settings.USER_LOG_ASYNC,
+    entry is queued to redis and written by write_queued_user_logs. """
+    if not settings.USER_LOG_ASYNC:
+        Log.objects.create(user_id=username, bid_public=bid_public, message=message, remote_ip=remote_ip, status=status)
+        return
+    entry = json.dumps({"bid_public": bid_public, "message": message, "remote_ip": remote_ip, "status": status, "timestamp": time.time()})
+    pipe = redis_instance.pipeline()
+    pipe.rpush(USER_LOG_QUEUE_KEY % username, entry)
+    pipe.sadd(USER_LOG_QUEUE_USERS_KEY, username)
+    pipe.execute()
+    sd.incr("login_frontend.models.write_user_log.queued", 1)
+
+def queued_log_entry(username, item):
+    """ Returns unsaved Log object for queued entry """
+    data = json.loads(item)
+    timestamp = datetime.datetime.utcfromtimestamp(data["timestamp"]).replace(tzinfo=timezone.utc)
+    return Log(user_id=username, timestamp=timestamp, bid_public=data["bid_public"], message=data["message"], remote_ip=data["remote_ip"], status=data["status"])
+
+@sd.timer("login_frontend.models.write_queued_user_logs")
+def write_queued_user_logs(usernames=None):
+    """ Writes queued log entries to database, for specified users or for
+    everyone. Called periodically by huey, and before showing log entries,
+    so that the newest entries are always visible. Returns number of entries written. """
+    if not settings.USER_LOG_ASYNC:
+        return 0
+    if usernames is None:
+        usernames = redis_instance.smembers(USER_LOG_QUEUE_USERS_KEY)
+    entries = []
+    for username in usernames:
+        # Take all entries for a single user atomically.
+        pipe = redis_instance.pipeline()
+        pipe.lrange(USER_LOG_QUEUE_KEY % username, 0, -1)
+        pipe.delete(USER_LOG_QUEUE_KEY % username)
+        pipe.srem(USER_LOG_QUEUE_USERS_KEY, username)
+        (items, _, _) = pipe.execute()
+        entries.extend([(username, item) for item in items])
+    if not entries:
+        return 0
+
+    try:
+        with transaction.atomic():
+            Log.objects.bulk_create([queued_log_entry(username, item) for (username, item) in entries], batch_size=settings.USER_LOG_BATCH_SIZE)
+        written = len(entries)
+    except Exception, e:
+        # Single invalid entry (for example, removed user) fails the whole
+        # batch. Write entries one by one, so that it does not block others.
+        log.error("Writing %s queued user log entries failed: %s. Writing entries separately.", len(entries), e)
+        written = write_user_log_entries(entries)
+    sd.incr("login_frontend.models.write_queued_user_logs.written", written)
+    return written
+
+def write_user_log_entries(entries):
+    """ Writes queued (username, entry) pairs one at a time. Failed entries
+    are queued again, and moved to USER_LOG_DEAD_LETTER_KEY after
+    USER_LOG_MAX_ATTEMPTS failures. Returns number of entries written. """
+    written = 0
+    pipe = redis_instance.pipeline()
+    for (username, item) in entries:
+        try:
+            with transaction.atomic():
+                queued_log_entry(username, item).save()
+            written += 1
+            continue
+        except Exception, e:
+            log.error("Writing queued user log entry for %s failed: %s", username, e)
+        try:
+            data = json.loads(item)
+        except ValueError:
+            data = {}
+        data["attempts"] = data.get("attempts", 0) + 1
+        if not data.get("timestamp") or data["attempts"] >= USER_LOG_MAX_ATTEMPTS:
+            log.error("Giving up writing queued user log entry for %s: %s", username, item)
+            sd.incr("login_frontend.models.write_queued_user_logs.dead_letter", 1)
+            pipe.rpush(USER_LOG_DEAD_LETTER_KEY, json.dumps({"username": username, "entry": item}))
+        else:
+            pipe.rpush(USER_LOG_QUEUE_KEY % username, json.dumps(data))
+            pipe.sadd(USER_LOG_QUEUE_USERS_KEY, username)
+    pipe.execute()
+    return written
 
 
 class Log(models.Model):
     user = models.ForeignKey('User')
-    timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
+    # Not auto_now_add: queued entries (see write_queued_user_logs) keep their original timestamp.
+    timestamp = models.DateTimeField(default=timezone.now, editable=False, db_index=True)
     bid_public = models.CharField(max_length=37, null=True, blank=True, db_index=True)
     remote_ip = models.CharField(max_length=47, null=True, blank=True, db_index=True)
     message = models.TextField()
@@ -150,6 +281,36 @@ class Log(models.Model):
         return u"%s %s@%s with %s: %s (%s)" % (self.timestamp, self.user, self.remote_ip, self.bid_public, self.message, self.status)
 
 
+def parse_ua(ua):
+    """ Returns Browser.ua_* fields parsed from user-agent string """
+    data = httpagentparser.detect(ua or "")
+    fields = {"ua_browser_name": None, "ua_browser_version": None, "ua_os_name": None, "ua_os_version": None}
+    browser = data.get("browser", {})
+    fields["ua_browser_name"] = browser.get("name")
+    fields["ua_browser_version"] = browser.get("version")
+    # Distribution and platform are more specific than os.
+    for key in ("dist", "platform", "os"):
+        if "name" in data.get(key, {}):
+            fields["ua_os_name"] = data[key]["name"]
+            if key != "os":
+                fields["ua_os_version"] = data[key].get("version")
+            break
+    for (field, max_length) in (("ua_browser_name", 100), ("ua_browser_version", 50), ("ua_os_name", 100), ("ua_os_version", 50)):
+        if fields[field]:
+            fields[field] = fields[field][:max_length]
+
+    ua_class = classify_ua(ua)
+    if ua_class.is_bot:
+        fields["ua_device"] = "bot"
+    elif "tablet" in ua_class.icons:
+        fields["ua_device"] = "tablet"
+    elif "mobile" in ua_class.icons:
+        fields["ua_device"] = "mobile"
+    else:
+        fields["ua_device"] = "desktop"
+    return fields
+
+
 class Browser(models.Model):
 
     L_UNAUTH = 0
@@ -188,6 +349,13 @@ class Browser(models.Model):
     user = models.ForeignKey('User', null=True)
     ua = models.CharField(max_length=250) # browser user agent
 
+    # Parsed from ua by update_ua_fields
+    ua_browser_name = models.CharField(max_length=100, null=True, blank=True)
+    ua_browser_version = models.CharField(max_length=50, null=True, blank=True)
+    ua_os_name = models.CharField(max_length=100, null=True, blank=True)
+    ua_os_version = models.CharField(max_length=50, null=True, blank=True)
+    ua_device = models.CharField(max_length=10, null=True, blank=True) # desktop, mobile, tablet or bot. None if ua is not parsed yet.
+
     created = models.DateTimeField(auto_now_add=True, db_index=True)
     modified = models.DateTimeField(auto_now=True, db_index=True)
 
@@ -215,6 +383,14 @@ class Browser(models.Model):
     def __unicode__(self):
         return u"%s: %s" % (self.bid_public, self.ua)
 
+    def save(self, *args, **kwargs):
+        """ Saves browser and invalidates cached row. logout, set_auth_state
+        and set_auth_level always go through this. """
+        if self.ua_device is None:
+            self.update_ua_fields()
+        super(Browser, self).save(*args, **kwargs)
+        if settings.BROWSER_CACHE_ENABLED:
+            invalidate_cached_row(BROWSER_CACHE_KEY % self.bid, BROWSER_VERSION_KEY % self.bid)
 
     @sd.timer("login_frontend.models.Browser.auth_state_changed")
     def auth_state_changed(self):
@@ -255,32 +431,27 @@ class Browser(models.Model):
            (Browser.C_BID_SESSION, {"value": self.bid_session, "secure": settings.SECURE_COOKIES, "httponly": True})
         ]
 
+    def get_auth_validity_time(self):
+        """ Returns validity time for new authentication state/level """
+        # TODO: logic for determining proper timeouts
+        if self.user.emulate_legacy:
+            return datetime.timedelta(hours=10)
+        if self.save_browser:
+            return datetime.timedelta(days=14)
+        return datetime.timedelta(days=1)
+
     @sd.timer("login_frontend.models.Browser.set_auth_state")
     def set_auth_state(self, state):
-        # TODO: logic for determining proper timeouts
         self.auth_state = state
-        if self.user.emulate_legacy:
-            validity_time = datetime.timedelta(hours=10)
-        else:
-            if self.save_browser:
-                validity_time = datetime.timedelta(days=14)
-            else:
-                validity_time = datetime.timedelta(days=1)
-        self.auth_state_valid_until = timezone.now() + validity_time
+        self.auth_state_valid_until = timezone.now() + self.get_auth_validity_time()
+        self.invalidate_auth_state_level()
         self.save()
 
     @sd.timer("login_frontend.models.Browser.set_auth_level")
     def set_auth_level(self, level):
-        # TODO: logic for determining proper timeouts
         self.auth_level = level
-        if self.user.emulate_legacy:
-            validity_time = datetime.timedelta(hours=10)
-        else:
-            if self.save_browser:
-                validity_time = datetime.timedelta(days=14)
-            else:
-                validity_time = datetime.timedelta(days=1)
-        self.auth_level_valid_until = timezone.now() + validity_time
+        self.auth_level_valid_until = timezone.now() + self.get_auth_validity_time()
+        self.invalidate_auth_state_level()
         self.save()
 
         if self.user:
@@ -291,21 +462,73 @@ class Browser(models.Model):
                 browser_user.max_auth_level = level
             browser_user.save()
 
-    @sd.timer("login_frontend.models.Browser.get_auth_state_level")
+    @sd.timer("login_frontend.models.Browser.transition")
+    def transition(self, level, state, notify=True):
+        """ Sets authentication level and state.
+
+        Equivalent to set_auth_level + set_auth_state + auth_state_changed,
+        but Browser is saved only once, and BrowserUsers is updated with
+        a single query. If notify is False, auth_state_changed is not called.
+        """
+        now = timezone.now()
+        valid_until = now + self.get_auth_validity_time()
+        self.auth_level = level
+        self.auth_state = state
+        self.auth_level_valid_until = valid_until
+        self.auth_state_valid_until = valid_until
+        self.invalidate_auth_state_level()
+        with transaction.atomic():
+            self.save()
+            if self.user:
+                # Update timestamp (and highest level), if level is not lower than the previous highest level.
+                updated = BrowserUsers.objects.filter(browser=self, user=self.user, max_auth_level__lte=level).update(auth_timestamp=now, max_auth_level=level)
+                if not updated:
+                    # Either level is lower than max_auth_level, or row does not exist yet.
+                    BrowserUsers.objects.get_or_create(browser=self, user=self.user, defaults={"auth_timestamp": now, "max_auth_level": level})
+        if notify:
+            self.auth_state_changed()
+
+    def invalidate_auth_state_level(self):
+        """ Drops memoized get_auth_state_level value """
+        self._auth_state_level_memo = None
+
     def get_auth_state_level(self):
+        """ Returns (auth_state, auth_level) tuple.
+
+        Value is memoized on this instance. It is recalculated if any of the
+        inputs changes, or when the next validity boundary is passed. """
+        now = timezone.now()
+        key = (self.user_id, self.auth_state, self.auth_level, self.auth_state_valid_until, self.auth_level_valid_until)
+        memo = getattr(self, "_auth_state_level_memo", None)
+        if memo and memo[0] == key and (memo[1] is None or now < memo[1]):
+            return memo[2]
+
+        value = self._get_auth_state_level(now)
+
+        # Value changes when any of these timestamps is passed
+        boundaries = []
+        for valid_until in (self.auth_state_valid_until, self.auth_level_valid_until):
+            if valid_until:
+                boundaries.extend([valid_until, valid_until + datetime.timedelta(days=60)])
+        boundaries = [boundary for boundary in boundaries if boundary > now]
+        self._auth_state_level_memo = (key, min(boundaries) if boundaries else None, value)
+        return value
+
+    @sd.timer("login_frontend.models.Browser.get_auth_state_level")
+    def _get_auth_state_level(self, now):
         # TODO: logic for determining proper authentication state
         if not self.user:
             return (Browser.S_REQUEST_BASIC, Browser.L_UNAUTH)
 
         # If valid_until has been expired for 60 days, require more authentication
-        if self.auth_state_valid_until and self.auth_state_valid_until < timezone.now() - datetime.timedelta(days=60):
+        if self.auth_state_valid_until and self.auth_state_valid_until < now - datetime.timedelta(days=60):
             return (Browser.S_REQUEST_BASIC, Browser.L_UNAUTH)
 
         # If valid_until has been expired for 60 days, require more authentication
-        if self.auth_level_valid_until and self.auth_level_valid_until < timezone.now() - datetime.timedelta(days=60):
+        if self.auth_level_valid_until and self.auth_level_valid_until < now - datetime.timedelta(days=60):
             return (Browser.S_REQUEST_BASIC, Browser.L_UNAUTH)
 
-        if not self.auth_state_valid_until or self.auth_state_valid_until < timezone.now() or not self.auth_level_valid_until or self.auth_level_valid_until < timezone.now():
+        if not self.auth_state_valid_until or self.auth_state_valid_until < now or not self.auth_level_valid_until or self.auth_level_valid_until < now:
             if self.auth_level == Browser.L_STRONG_SKIPPED:
                 # Authenticated to strong authentication, but with skipping. Request strong
                 # authentication again, except for legacy mode.
@@ -330,17 +553,14 @@ class Browser(models.Model):
 
         return (self.auth_state, self.auth_level)
 
-    @sd.timer("login_frontend.models.Browser.get_auth_state")
     def get_auth_state(self):
         (auth_state, auth_level) = self.get_auth_state_level()
         return auth_state
 
-    @sd.timer("login_frontend.models.Browser.get_auth_level")
     def get_auth_level(self):
         (auth_state, auth_level) = self.get_auth_state_level()
         return auth_level
 
-    @sd.timer("login_frontend.models.Browser.is_authenticated")
     def is_authenticated(self):
         if self.get_auth_level() >= Browser.L_STRONG and self.get_auth_state() == Browser.S_AUTHENTICATED:
             return True
@@ -473,32 +693,26 @@ Requested from %s""" % request.remote_ip
         self.auth_level_valid_until = None
         self.auth_state_valid_until = None
         self.authenticator_qr_nonce = None
+        self.invalidate_auth_state_level()
         if request is not None:
             django_logout(request)
         self.save()
         self.auth_state_changed()
 
+    def update_ua_fields(self):
+        """ Sets parsed user-agent fields from ua. Call this if ua is changed. """
+        for (field, value) in parse_ua(self.ua).items():
+            setattr(self, field, value)
+
     @sd.timer("login_frontend.models.Browser.get_readable_ua")
     def get_readable_ua(self):
         """ Returns user-agent in readable format """
-        data = httpagentparser.detect(self.ua)
-        browser = None
-        os = None
-        if "browser" in data and "name" in data["browser"]:
-            browser = data["browser"]["name"]
-        if "dist" in data and "name" in data["dist"]:
-            if "version" in data["dist"]:
-                os = "%s (%s)" % (data["dist"]["name"], data["dist"]["version"])
-            else:
-                os = data["dist"]["name"]
-
-        elif "platform" in data and "name" in data["platform"]:
-            if "version" in data["platform"]:
-                os = "%s (%s)" % (data["platform"]["name"], data["platform"]["version"])
-            else:
-                os = data["platform"]["name"]
-        elif "os" in data and "name" in data["os"]:
-            os = data["os"]["name"]
+        if self.ua_device is None:
+            self.update_ua_fields()
+        browser = self.ua_browser_name
+        os = self.ua_os_name
+        if os and self.ua_os_version:
+            os = "%s (%s)" % (os, self.ua_os_version)
         if browser:
             if os:
                 return "%s on %s" % (browser, os)
@@ -506,61 +720,30 @@ Requested from %s""" % request.remote_ip
                 return "%s on unknown platform" % (browser)
         return self.ua
 
-    UA_DETECT = {
-        ".*Maemo": ["linux", "mobile"],
-        ".*Opera.*S60": ["mobile"],
-        ".*Opera.*Android": ["android", "mobile"],
-        ".*Opera.*Windows.*Mini": ["windows", "mobile"],
-        ".*Opera.*iPhone": ["apple", "mobile"],
-        ".*Opera.*iPad": ["apple", "tablet"],
-        ".*Android.*Mobile": ["android", "mobile"],
-        "^.*Android((?!Mobile).)*$": ["android", "tablet"],
-        ".*\(iPad": ["apple", "tablet"],
-        ".*\(iPhone": ["apple", "mobile"],
-        ".*Macintosh": ["apple", "laptop"],
-        ".*BlackBerry": ["mobile"],
-        ".*Bolt": ["mobile"],
-        ".*Symbian": ["mobile"],
-        ".*Fennec": ["mobile"],
-        ".*IEMobile": ["mobile"],
-        ".*Mobile": ["mobile"],
-        ".*[Aa]ndroid": ["android", "mobile"],
-        ".*Windows Phone": ["windows", "mobile"],
-        ".*Windows.*Mobile": ["windows", "mobile"],
-        ".*Windows": ["windows"],
-        ".*Linux": ["linux"],
-    }
-
     @sd.timer("login_frontend.models.Browser.get_ua_icons")
     def get_ua_icons(self):
         """ Returns Font Awesome icons for platform and OS """
-        icon = ["question"] # By default, show unknown icon
-        for (regex, icons) in self.UA_DETECT.iteritems():
-            if re.match(regex, self.ua):
-                return icons
-        return icon
+        return classify_ua(self.ua).icons
 
     @sd.timer("login_frontend.models.Browser.compare_ua")
     def compare_ua(self, ua):
         # TODO: Validate this code.
         if ua == self.ua:
             return True
-        old_ua = httpagentparser.detect(self.ua)
-        new_ua = httpagentparser.detect(ua)
-        keys = {"os": ["version", "name"], "browser": ["version", "name"]}
-        if "os" in old_ua and "os" in new_ua:
-            if old_ua["os"] != new_ua["os"]:
+        if self.ua_device is None:
+            self.update_ua_fields()
+        new_ua = parse_ua(ua)
+        if self.ua_os_name and new_ua["ua_os_name"]:
+            if (self.ua_os_name, self.ua_os_version) != (new_ua["ua_os_name"], new_ua["ua_os_version"]):
                 return False
-        if "browser" in old_ua and "browser" in new_ua:
-            ou = old_ua["browser"]
-            nu = new_ua["browser"]
-            if ou.get("name") != nu.get("name"):
+        if self.ua_browser_name and new_ua["ua_browser_name"]:
+            if self.ua_browser_name != new_ua["ua_browser_name"]:
                 return False
-            if ou.get("version") == nu.get("version"):
+            if self.ua_browser_version == new_ua["ua_browser_version"]:
                 return True
             try:
-                ou_v = LooseVersion(ou.get("version"))
-                nu_v = LooseVersion(nu.get("version"))
+                ou_v = LooseVersion(self.ua_browser_version)
+                nu_v = LooseVersion(new_ua["ua_browser_version"])
             except AttributeError:
                 return False # Something fishy with version strings
             if nu_v < ou_v:
@@ -658,6 +841,17 @@ class BrowserLogin(models.Model):
 
     signed_out = models.BooleanField(default=False, help_text="Session has been closed")
 
+@sd.timer("login_frontend.models.sign_out_logins")
+def sign_out_logins(logins):
+    """ Marks BrowserLogin queryset as signed out with a single UPDATE.
+    Returns list of affected BrowserLogin IDs. """
+    ids = list(logins.filter(signed_out=False).values_list("id", flat=True))
+    if not ids:
+        return ids
+    count = BrowserLogin.objects.filter(id__in=ids).update(signed_out=True)
+    sd.incr("login_frontend.models.sign_out_logins.rows", count)
+    return ids
+
 class BrowserUsers(models.Model):
 
     class Meta:
@@ -751,6 +945,13 @@ class User(models.Model):
 
     user_tokens = models.CharField(max_length=255, null=True, blank=True, help_text="List of pubtkt tokens")
 
+    def save(self, *args, **kwargs):
+        """ Saves user and invalidates cached row. sign_out_all and
+        refresh_strong always go through this or Browser.save. """
+        super(User, self).save(*args, **kwargs)
+        if settings.BROWSER_CACHE_ENABLED:
+            invalidate_cached_row(USER_CACHE_KEY % self.username, USER_VERSION_KEY % self.username)
+
     def get_authenticator_id(self):
         if self.strong_authenticator_id:
             return self.strong_authenticator_id
@@ -781,7 +982,7 @@ class User(models.Model):
                 browser.save()
             elif kwargs.get("remote_logout"):
                 message = "You remotely signed out this browser"
-            Log.objects.create(user=self, bid_public=bid_public, status=status, message=message, remote_ip=remote_ip)
+            write_user_log(self.username, bid_public, message, remote_ip, status)
 
     def reset(self):
         self.strong_configured = False
@@ -816,48 +1017,55 @@ class User(models.Model):
         if not self.strong_authenticator_secret:
             return (False, "Authenticator is not configured")
 
-        totp = pyotp.TOTP(self.strong_authenticator_secret)
-        for timestamp in [time.time() - 30, time.time(), time.time() + 30]:
-            totp_code = ("000000"+str(totp.at(timestamp)))[-6:]
-            custom_log(request, "Comparing '%s' and '%s'" % (totp_code, code), level="debug")
-            if str(code) == totp_code:
-                r_k = "used-otp-%s-%s" % (self.username, totp_code)
-                already_used = dcache.get(r_k)
-                if already_used:
-                    return (False, "OTP was already used. Please wait for 30 seconds and try again.")
-                dcache.set(r_k, True, 900)
-                return (True, None)
+        code = str(code)
+        if not is_totp_code(code):
+            # Does not match to any TOTP code.
+            return (False, "Incorrect OTP code.")
+
+        window = TotpWindow()
+        window.add(self.strong_authenticator_secret, CURRENT_OFFSETS)
+        if window.match(code):
+            r_k = "used-otp-%s-%s" % (self.username, code)
+            already_used = dcache.get(r_k)
+            if already_used:
+                return (False, "OTP was already used. Please wait for 30 seconds and try again.")
+            dcache.set(r_k, True, 900)
+            return (True, None)
 
         # Either timestamp is way off or user entered incorrect OTP.
         custom_log(request, "Invalid OTP - does not match to current Authenticator code", level="info")
 
-        for time_diff in range(-900, 900, 30):
-            timestamp = time.time() + time_diff
-            totp_code = ("000000"+str(totp.at(timestamp)))[-6:]
-            if str(code) == totp_code:
+        # Codes for CURRENT_OFFSETS are not computed again.
+        window.add(self.strong_authenticator_secret, DRIFT_OFFSETS)
+        match = window.match(code)
+        if match:
+            time_diff = match[0]
+            custom_log(request, "User clock is off by %s seconds" % time_diff, level="warn")
+            add_user_log(request, "Clock of your mobile phone is off by %s seconds" % time_diff, status="clock-o")
+            message = "Incorrect code. It seems your clock is off by about %s seconds" % time_diff
+            if time_diff < 0:
+                message += ", or you waited too long before entering the code"
+            message += "."
+            return (False, message)
+
+        # No match from current authentication even with time offset. Try the newest old codes.
+        old_authenticators = {}
+        for authenticator in AuthenticatorCode.objects.filter(user=self).exclude(authenticator_secret=self.strong_authenticator_secret).order_by("-generated_at")[:settings.AUTHENTICATOR_OLD_SECRETS_MAX]:
+            old_authenticators.setdefault(authenticator.authenticator_secret, authenticator)
+        old_window = TotpWindow(window.timestamp)
+        for secret in old_authenticators:
+            old_window.add(secret, DRIFT_OFFSETS)
+        match = old_window.match(code)
+        if match:
+            (time_diff, secret) = match
+            authenticator = old_authenticators[secret]
+            custom_log(request, "User tried to use authenticator configured at %s" % authenticator.generated_at, level="info")
+            if abs(time_diff) < 35:
+                message = "You tried to use old Authenticator configuration, generated at %s. If you don't have newer configuration, please sign in with SMS and reconfigure Authenticator." % authenticator.generated_at
+            else:
+                message = "You tried to use old Authenticator configuration, generated at %s. If you don't have newer configuration, please sign in with SMS and reconfigure Authenticator. Also, clock of your mobile phone seems to be off by about %s seconds" % (authenticator.generated_at, time_diff)
                 custom_log(request, "User clock is off by %s seconds" % time_diff, level="warn")
-                add_user_log(request, "Clock of your mobile phone is off by %s seconds" % time_diff, status="clock-o")
-                message = "Incorrect code. It seems your clock is off by about %s seconds" % time_diff
-                if time_diff < 0:
-                    message += ", or you waited too long before entering the code"
-                message += "."
-                return (False, message)
-
-        # No match from current authentication even with time offset. Try old codes.
-        old_authenticators = AuthenticatorCode.objects.filter(user=self)
-        for authenticator in old_authenticators:
-            totp = pyotp.TOTP(authenticator.authenticator_secret)
-            for time_diff in range(-900, 900, 30):
-                timestamp = time.time() + time_diff
-                totp_code = ("000000"+str(totp.at(timestamp)))[-6:]
-                if str(code) == totp_code:
-                    custom_log(request, "User tried to use authenticator configured at %s" % authenticator.generated_at, level="info")
-                    if abs(time_diff) < 35:
-                        message = "You tried to use old Authenticator configuration, generated at %s. If you don't have newer configuration, please sign in with SMS and reconfigure Authenticator." % authenticator.generated_at
-                    else:
-                        message = "You tried to use old Authenticator configuration, generated at %s. If you don't have newer configuration, please sign in with SMS and reconfigure Authenticator. Also, clock of your mobile phone seems to be off by about %s seconds" % (authenticator.generated_at, time_diff)
-                        custom_log(request, "User clock is off by %s seconds" % time_diff, level="warn")
-                    return (False, message)
+            return (False, message)
 
         return (False, "Incorrect OTP code.")
 
@@ -12,50 +12,23 @@ from django.http import HttpResponseRedirect
 from django.shortcuts import render_to_response
 from django.template import RequestContext
 from django.utils import timezone
-from login_frontend.models import Browser, BrowserLogin, add_user_log, UserService
+from login_frontend.models import Browser, BrowserLogin, add_user_log, UserService, sign_out_logins
 from urlparse import urlparse
 from login_frontend.utils import redirect_with_get_params
+from login_frontend.request_log import request_logger
 import auth_pubtkt
 import datetime
 import json
 import logging
 import time
 import urllib
-import os
-import sys
 from django_statsd.clients import statsd as sd
 
 privkey = settings.PUBTKT_PRIVKEY
 
 log = logging.getLogger(__name__)
 
-@sd.timer("login_frontend.providers.custom_log")
-def custom_log(request, message, **kwargs):
-    """ Automatically logs username, remote IP and bid_public """
-    try:
-        raise Exception
-    except:
-        stack = sys.exc_info()[2].tb_frame.f_back
-    if stack is not None:
-        stack = stack.f_back
-    while hasattr(stack, "f_code"):
-        co = stack.f_code
-        filename = os.path.normcase(co.co_filename)
-        filename = co.co_filename
-        lineno = stack.f_lineno
-        co_name = co.co_name
-        break
-
-    level = kwargs.get("level", "info")
-    method = getattr(log, level)
-    remote_addr = request.remote_ip
-    bid_public = username = ""
-    if hasattr(request, "browser") and request.browser:
-        bid_public = request.browser.bid_public
-        if request.browser.user:
-            username = request.browser.user.username
-    method("[%s:%s:%s] %s - %s - %s - %s", filename, lineno, co_name,
-                            remote_addr, username, bid_public, message)
+custom_log = request_logger(log)
 
 
 __all__ = ["internal_login", "pubtkt_logout", "pubtkt"]
@@ -112,11 +85,9 @@ def pubtkt_logout(request, response = None):
         custom_log(request, "pubtkt_logout: cookie exists, but response object was not specified.", level="debug")
         return response
 
-    browser_login = BrowserLogin.objects.filter(browser=request.browser, sso_provider="pubtkt", signed_out=False)
-    for login in browser_login:
-        custom_log(request, "pubtkt_logout: Marking %s as signed out" % login.id, level="info")
-        login.signed_out = True
-        login.save()
+    signed_out = sign_out_logins(BrowserLogin.objects.filter(browser=request.browser, sso_provider="pubtkt"))
+    if signed_out:
+        custom_log(request, "pubtkt_logout: Marked %s as signed out" % signed_out, level="info")
     return response
 
 @sd.timer("login_frontend.providers.pubtkt")
@@ -0,0 +1,57 @@
+"""
+Request logging.
+
+custom_log = request_logger(log) creates custom_log(request, message, level="info"),
+which automatically adds caller, remote IP, username and bid_public to log entries.
+"""
+
+import logging
+import sys
+
+__all__ = ["request_logger"]
+
+LEVELS = {
+    "debug": logging.DEBUG,
+    "info": logging.INFO,
+    "warn": logging.WARNING,
+    "warning": logging.WARNING,
+    "error": logging.ERROR,
+    "critical": logging.CRITICAL,
+}
+
+
+def get_log_context(request):
+    """ Returns (remote_ip, username, bid_public) for request.
+
+    Value is cached on the request, and recalculated only if browser or
+    user changes (for example, on sign-in or sign-out). """
+    browser = getattr(request, "browser", None)
+    user_id = getattr(browser, "user_id", None)
+    cached = getattr(request, "_log_context", None)
+    if cached and cached[0] is browser and cached[1] == user_id:
+        return cached[2]
+    bid_public = username = ""
+    if browser:
+        bid_public = browser.bid_public
+        # User primary key is username.
+        username = user_id or ""
+    context = (getattr(request, "remote_ip", None), username, bid_public)
+    request._log_context = (browser, user_id, context)
+    return context
+
+
+def request_logger(logger):
+    """ Returns custom_log function bound to logger """
+
+    def custom_log(request, message, **kwargs):
+        """ Automatically logs username, remote IP and bid_public """
+        level = LEVELS[kwargs.get("level", "info")]
+        if not logger.isEnabledFor(level):
+            return
+        frame = sys._getframe(1)
+        co = frame.f_code
+        (remote_addr, username, bid_public) = get_log_context(request)
+        logger.log(level, "[%s:%s:%s] %s - %s - %s - %s", co.co_filename, frame.f_lineno, co.co_name,
+                                remote_addr, username, bid_public, message)
+
+    return custom_log
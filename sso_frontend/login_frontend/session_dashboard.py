@@ -0,0 +1,103 @@
+"""
+Data for sessions page.
+
+All browsers of the user are loaded with a constant number of queries,
+independent of the number of browsers: one for sessions and browsers, two
+for latest p0f and time sync entries each, and one for active logins.
+Last known locations are fetched from cache with a single get_many.
+
+Result is cached for settings.SESSIONS_CACHE_TIMEOUT seconds per user.
+Request specific data (current browser, buffered last seen timestamps,
+location strings) is not cached.
+"""
+
+from django.conf import settings
+from django.core.cache import get_cache
+from django.db.models import Max, Q
+from django.utils import timezone
+from login_frontend.models import BrowserLogin, BrowserP0f, BrowserTime, BrowserUsers
+import datetime
+from django_statsd.clients import statsd as sd
+
+__all__ = ["load_sessions", "invalidate_sessions"]
+
+dcache = get_cache("default")
+
+CACHE_KEY = "sessions-dashboard-%s"
+
+LOCATION_CACHE_KEYS = [
+    ("last_known_location", "last-known-location-%s"),
+    ("last_known_location_from", "last-known-location-from-%s"),
+    ("last_known_location_timestamp", "last-known-location-timestamp-%s"),
+]
+
+
+def latest_per_browser(model, field, browser_ids):
+    """ Returns {browser_id: latest entry} for model, ordered by field """
+    latest = model.objects.filter(browser__in=browser_ids).values("browser").annotate(latest=Max(field))
+    latest = dict([(item["browser"], item["latest"]) for item in latest])
+    if not latest:
+        return {}
+    ret = {}
+    # Matches timestamps from other browsers too. These are filtered out below.
+    filters = {"browser__in": latest.keys(), "%s__in" % field: set(latest.values())}
+    for entry in model.objects.filter(**filters):
+        if getattr(entry, field) == latest[entry.browser_id]:
+            ret[entry.browser_id] = entry
+    return ret
+
+
+@sd.timer("login_frontend.session_dashboard.load")
+def _load_sessions(user):
+    sessions = list(BrowserUsers.objects.filter(user=user, browser__user=user).select_related("browser"))
+    browser_ids = [session.browser_id for session in sessions]
+    if not browser_ids:
+        return []
+
+    p0f = latest_per_browser(BrowserP0f, "updated_at", browser_ids)
+    timesync = latest_per_browser(BrowserTime, "checked_at", browser_ids)
+
+    logins = {}
+    for login in BrowserLogin.objects.filter(user=user, browser__in=browser_ids).filter(can_logout=False).filter(signed_out=False).filter(Q(expires_at__gte=timezone.now()) | Q(expires_at=None)):
+        logins.setdefault(login.browser_id, []).append(login)
+
+    cache_keys = [k % session.browser.bid_public for session in sessions for (_, k) in LOCATION_CACHE_KEYS]
+    locations = dcache.get_many(cache_keys)
+
+    ret = []
+    for session in sessions:
+        browser = session.browser
+        details = {"session": session, "browser": browser}
+        if browser.pk in p0f:
+            details["p0f"] = p0f[browser.pk]
+        if browser.pk in timesync:
+            details["timesync"] = timesync[browser.pk]
+        details["logins"] = logins.get(browser.pk, [])
+        for tk, k in LOCATION_CACHE_KEYS:
+            val = locations.get(k % browser.bid_public)
+            if val:
+                if tk == "last_known_location_timestamp":
+                    val = datetime.datetime.fromtimestamp(float(val))
+                details[tk] = val
+        ret.append(details)
+    return ret
+
+
+def load_sessions(user):
+    """ Returns list of {"session", "browser", "logins", and optionally
+    "p0f", "timesync" and "last_known_location*"} dicts, one for each
+    browser of the user. """
+    key = CACHE_KEY % user.username
+    sessions = dcache.get(key)
+    if sessions is not None:
+        sd.incr("login_frontend.session_dashboard.cache_hit", 1)
+        return sessions
+    sd.incr("login_frontend.session_dashboard.cache_miss", 1)
+    sessions = _load_sessions(user)
+    dcache.set(key, sessions, settings.SESSIONS_CACHE_TIMEOUT)
+    return sessions
+
+
+def invalidate_sessions(user):
+    """ Removes cached sessions data. Call after changing user's browsers. """
+    dcache.delete(CACHE_KEY % user.username)
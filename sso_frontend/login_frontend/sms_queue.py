@@ -0,0 +1,96 @@
+"""
+Asynchronous SMS dispatch.
+
+queue_sms queues one huey task per phone number, so messages to primary and
+secondary phones are sent in parallel by huey workers, without blocking the
+request. Failed sends are retried with exponential backoff. Delivery status
+for each phone is stored to redis, and shown on SMS authentication page.
+"""
+
+from django.conf import settings
+from login_frontend.models import write_user_log
+from login_frontend.send_sms import send_sms
+import logging
+import redis
+import time
+from django_statsd.clients import statsd as sd
+
+log = logging.getLogger(__name__)
+
+r = redis.Redis()
+
+STATUS_KEY = "sms-status-%s-%s"
+QUEUE_DEPTH_KEY = "sms-queue-depth"
+STATUS_TIMEOUT = 900 # seconds, same as SMS code validity time
+
+__all__ = ["redact_phone", "queue_sms", "get_sms_status", "deliver_sms"]
+
+
+def redact_phone(phone):
+    return "%s...%s" % (phone[0:6], phone[-4:])
+
+
+def get_status_key(browser):
+    return STATUS_KEY % (browser.bid_public, browser.sms_code_id)
+
+
+def update_queue_depth(change):
+    depth = r.incr(QUEUE_DEPTH_KEY, change)
+    sd.gauge("login_frontend.sms_queue.depth", depth)
+
+
+@sd.timer("login_frontend.sms_queue.queue_sms")
+def queue_sms(browser, phones, text):
+    """ Queues text to all phones. Returns immediately. """
+    from login_frontend.tasks import send_sms_task
+    status_key = get_status_key(browser)
+    pipe = r.pipeline()
+    for phone in phones:
+        pipe.hset(status_key, redact_phone(phone), "queued")
+    pipe.expire(status_key, STATUS_TIMEOUT)
+    pipe.execute()
+    update_queue_depth(len(phones))
+    for phone in phones:
+        send_sms_task(status_key, browser.user_id, browser.bid_public, phone, text, 0, time.time())
+
+
+def get_sms_status(browser):
+    """ Returns {redacted phone number: status} for the latest SMS code """
+    return r.hgetall(get_status_key(browser))
+
+
+@sd.timer("login_frontend.sms_queue.deliver_sms")
+def deliver_sms(status_key, username, bid_public, phone, text, attempt, queued_at):
+    """ Sends a single message. Returns True if sending succeeded, False if
+    it should be retried, and None if it failed permanently. """
+    phone_redacted = redact_phone(phone)
+    start_time = time.time()
+    try:
+        status = send_sms(phone, text)
+    except Exception:
+        # For example, socket timeout. Handled as a failed attempt.
+        log.exception("Sending SMS to %s for %s raised an exception", phone, username)
+        sd.incr("login_frontend.sms_queue.exception", 1)
+        status = False
+    sd.timing("login_frontend.sms_queue.send_time", int((time.time() - start_time) * 1000))
+
+    if status:
+        r.hset(status_key, phone_redacted, "sent")
+        update_queue_depth(-1)
+        sd.timing("login_frontend.sms_queue.delivery_time", int((time.time() - queued_at) * 1000))
+        log.info("Sent OTP to %s for %s (attempt %s)", phone, username, attempt + 1)
+        write_user_log(username, bid_public, "Sent OTP code to %s" % phone, None, "info")
+        return True
+
+    if attempt + 1 < settings.SMS_SEND_ATTEMPTS:
+        r.hset(status_key, phone_redacted, "retrying")
+        sd.incr("login_frontend.sms_queue.retry", 1)
+        log.warn("Sending SMS to %s for %s failed (attempt %s). Retrying.", phone, username, attempt + 1)
+        return False
+
+    r.hset(status_key, phone_redacted, "failed")
+    update_queue_depth(-1)
+    sd.incr("login_frontend.sms_queue.failed", 1)
+    log.warn("Sending SMS to %s for %s failed. No retries left.", phone, username)
+    write_user_log(username, bid_public, "Sending SMS to %s failed" % phone, None, "question")
+    return None
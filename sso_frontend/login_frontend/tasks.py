@@ -0,0 +1,56 @@
+"""
+Background tasks, executed by huey consumer (manage.py run_huey).
+"""
+
+from huey.djhuey import crontab, periodic_task, task
+from cspreporting.ingest import write_queued_reports
+from login_frontend.last_seen_buffer import flush_last_seen
+from login_frontend.ldap_auth import refresh_group_memberships
+from login_frontend.models import write_queued_user_logs
+from login_frontend.sms_queue import deliver_sms
+from openid_provider.utils import refresh_popular_trust_roots
+from django.conf import settings
+
+
+@task()
+def flush_browser_users_last_seen():
+    """ Writes buffered BrowserUsers last seen information to database """
+    flush_last_seen()
+
+
+@periodic_task(crontab(minute="*"))
+def flush_browser_users_last_seen_periodic():
+    """ Writes buffered BrowserUsers last seen information to database """
+    flush_last_seen()
+
+
+@periodic_task(crontab(minute="*"))
+def write_user_logs_periodic():
+    """ Writes queued user log entries to database """
+    write_queued_user_logs()
+
+
+@periodic_task(crontab(minute="*"))
+def write_csp_reports_periodic():
+    """ Writes queued CSP reports to database """
+    write_queued_reports()
+
+
+@periodic_task(crontab(minute="*/15"))
+def refresh_group_memberships_periodic():
+    """ Refreshes cached LDAP group memberships for active users """
+    refresh_group_memberships()
+
+
+@task()
+def send_sms_task(status_key, username, bid_public, phone, text, attempt, queued_at):
+    """ Sends a single SMS. On failure, retries with exponential backoff. """
+    if deliver_sms(status_key, username, bid_public, phone, text, attempt, queued_at) is False:
+        delay = settings.SMS_RETRY_DELAY * 2 ** attempt
+        send_sms_task.schedule(args=(status_key, username, bid_public, phone, text, attempt + 1, queued_at), delay=delay)
+
+
+@periodic_task(crontab(minute="*/20"))
+def refresh_popular_trust_roots_periodic():
+    """ Refreshes cached OpenID return URL verification results for most used relying parties """
+    refresh_popular_trust_roots()
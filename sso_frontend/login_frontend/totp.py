@@ -0,0 +1,52 @@
+"""
+TOTP verification with precomputed time windows.
+
+TotpWindow maps TOTP codes to (offset, secret) for a fixed point of time.
+Each code is computed only once per secret and time offset, and entered code
+is matched against all computed codes with a single dict lookup.
+"""
+
+import pyotp
+import time
+
+__all__ = ["TIME_STEP", "CURRENT_OFFSETS", "DRIFT_OFFSETS", "is_totp_code", "get_totp_code", "TotpWindow"]
+
+TIME_STEP = 30
+# Offsets accepted as valid codes
+CURRENT_OFFSETS = (-TIME_STEP, 0, TIME_STEP)
+# Offsets used for detecting clock drift
+DRIFT_OFFSETS = range(-900, 900, TIME_STEP)
+
+
+def is_totp_code(code):
+    """ Returns False if code can't match any TOTP code """
+    return len(code) == 6 and code.isdigit()
+
+
+def get_totp_code(totp, timestamp):
+    return ("000000" + str(totp.at(timestamp)))[-6:]
+
+
+class TotpWindow(object):
+    """ TOTP codes for one or more secrets around a fixed timestamp """
+
+    def __init__(self, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        self.timestamp = timestamp
+        self.codes = {} # code -> (offset, secret)
+        self.computed = set() # (secret, offset)
+
+    def add(self, secret, offsets):
+        """ Computes codes for secret. Already computed offsets are skipped.
+        If the same code is generated more than once, the first one is kept. """
+        totp = pyotp.TOTP(secret)
+        for offset in offsets:
+            if (secret, offset) in self.computed:
+                continue
+            self.computed.add((secret, offset))
+            self.codes.setdefault(get_totp_code(totp, self.timestamp + offset), (offset, secret))
+
+    def match(self, code):
+        """ Returns (offset, secret) for code, or None """
+        return self.codes.get(code)
@@ -0,0 +1,86 @@
+"""
+User-agent classification.
+
+All rules are compiled once to a single regular expression, with one
+alternative per rule. Alternatives are tried in order, so the first
+matching rule wins. Results are cached per user-agent string.
+"""
+
+from collections import namedtuple
+from login_frontend.lru_cache import LRUCache
+import re
+
+__all__ = ["UAClass", "BOT_UA", "UA_ICONS", "classify"]
+
+UAClass = namedtuple("UAClass", ["icons", "is_bot"])
+
+# Monitoring bots and command line tools. These are matched first.
+BOT_UA = [
+    "Wget/",
+    "Pingdom.com_bot_version",
+    "curl/",
+    "nutch-",
+]
+
+# Font Awesome icons for platform and OS, most specific first.
+UA_ICONS = [
+    (".*Maemo", ("linux", "mobile")),
+    (".*Opera.*S60", ("mobile",)),
+    (".*Opera.*Android", ("android", "mobile")),
+    (".*Opera.*Windows.*Mini", ("windows", "mobile")),
+    (".*Opera.*iPhone", ("apple", "mobile")),
+    (".*Opera.*iPad", ("apple", "tablet")),
+    (".*Android.*Mobile", ("android", "mobile")),
+    (".*Android((?!Mobile).)*$", ("android", "tablet")),
+    (".*\(iPad", ("apple", "tablet")),
+    (".*\(iPhone", ("apple", "mobile")),
+    (".*Macintosh", ("apple", "laptop")),
+    (".*Windows Phone", ("windows", "mobile")),
+    (".*Windows.*Mobile", ("windows", "mobile")),
+    (".*BlackBerry", ("mobile",)),
+    (".*Bolt", ("mobile",)),
+    (".*Symbian", ("mobile",)),
+    (".*Fennec", ("mobile",)),
+    (".*IEMobile", ("mobile",)),
+    (".*Mobile", ("mobile",)),
+    (".*[Aa]ndroid", ("android", "mobile")),
+    (".*Windows", ("windows",)),
+    (".*Linux", ("linux",)),
+]
+
+UNKNOWN_ICONS = ("question",)
+
+CACHE_SIZE = 2000
+
+
+def _compile():
+    """ Returns (compiled regex, {group name: UAClass}) """
+    alternatives = []
+    results = {}
+    rules = [(re.escape(prefix), UAClass(UNKNOWN_ICONS, True)) for prefix in BOT_UA]
+    rules += [(regex, UAClass(icons, False)) for (regex, icons) in UA_ICONS]
+    for (i, (regex, result)) in enumerate(rules):
+        name = "r%s" % i
+        alternatives.append("(?P<%s>%s)" % (name, regex))
+        results[name] = result
+    return (re.compile("(?:%s)" % "|".join(alternatives)), results)
+
+_regex, _results = _compile()
+_cache = LRUCache(CACHE_SIZE)
+
+
+def _classify(ua):
+    match = _regex.match(ua)
+    if match is None:
+        return UAClass(UNKNOWN_ICONS, False)
+    return _results[match.lastgroup]
+
+
+def classify(ua):
+    """ Returns UAClass(icons, is_bot) for user-agent string """
+    ua = ua or ""
+    result = _cache.get(ua)
+    if result is None:
+        result = _classify(ua)
+        _cache.set(ua, result)
+    return result
@@ -39,6 +39,7 @@ urlpatterns += patterns('login_frontend.authentication_views',
     url(r'^second$', 'secondstepauth'),
     url(r'^second/authenticator$', 'authenticate_with_authenticator'),
     url(r'^second/sms$', 'authenticate_with_sms'),
+    url(r'^second/sms/status$', 'authenticate_with_sms_status'),
     url(r'^second/emergency$', 'authenticate_with_emergency'),
     url(r'^urlauth/(?P<sid>(.+))$', 'authenticate_with_url'),
 
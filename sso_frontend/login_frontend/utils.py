@@ -9,14 +9,10 @@ from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.core.urlresolvers import reverse
 from django.http import HttpResponse, HttpResponseRedirect
 from django.utils import timezone
+from login_frontend.geoip import is_private_net, get_geoip_string
 from login_frontend.models import User, BrowserDetails, KeystrokeSequence
 import datetime
 import dateutil.parser
-import geoip2
-import geoip2.database
-import geoip2.errors
-import geoip2.models
-import ipaddr
 import logging
 import json
 import login_frontend._slumber_auth as _slumber_auth
@@ -33,9 +29,6 @@ dcache = get_cache("default")
 log = logging.getLogger(__name__)
 timing_log = logging.getLogger("timing_data")
 
-geo = geoip2.database.Reader(settings.GEOIP_DB)
-IP_NETWORKS = settings.IP_NETWORKS
-
 __all__ = ["redir_to_sso", "is_private_net", "save_timing_data", "get_and_refresh_user", "refresh_user", "get_geoip_string", "redirect_with_get_params", "dedup_messages", "paginate", "get_return_url"]
 
 
@@ -130,23 +123,6 @@ def redir_to_sso(request, **kwargs):
         return None
 
 
-@sd.timer("login_frontend.utils.is_private_net")
-def is_private_net(ip_address):
-    """ Returns True if specified in private networks, imported from
-        local_settings """
-    try:
-        ip = ipaddr.IPv4Address(ip_address)
-    except:
-        return False
-
-    for (network, _, _, description) in IP_NETWORKS:
-        if ((isinstance(network, ipaddr.IPv4Address) and
-            ip is network) or
-           (isinstance(network, ipaddr.IPv4Network) and
-            ip in network)):
-            return description
-    return False
-
 @sd.timer("login_frontend.utils.save_timing_data")
 def save_timing_data(request, user, timing_data):
     """ Saves timing data with username, UA and bid. """
@@ -249,22 +225,6 @@ def refresh_user(user): # pragma: no cover
         log.info("Changed or created new objects")
         return True
 
-@sd.timer("login_frontend.utils.get_geoip_string")
-def get_geoip_string(ip_address):
-    """ Returns short location string for IP address. """
-    private_net = is_private_net(ip_address)
-    if private_net:
-        return private_net
-    try:
-        data = geo.city(ip_address)
-    except:
-        return "Unknown"
-    country = data.country.iso_code
-    city = data.city.name
-    if city is None:
-        return "%s" % country
-    return "%s (%s)" % (country, city)
-
 @sd.timer("login_frontend.utils.redirect_with_get_params")
 def redirect_with_get_params(url_name, get_params = None):
     """ Returns HttpResponseRedirect with query string. """
@@ -25,22 +25,23 @@ if settings.FAKE_TESTING:
 else:
     from login_frontend.ldap_auth import LdapLogin
 from login_frontend.models import *
+from login_frontend.last_seen_buffer import buffered_last_seen
 from login_frontend.providers import pubtkt_logout
 from login_frontend.send_sms import send_sms
+from login_frontend.session_dashboard import load_sessions, invalidate_sessions
 from login_frontend.utils import save_timing_data, get_geoip_string, redirect_with_get_params, redir_to_sso, paginate, get_return_url
 from login_frontend.authentication_views import protect_view
+from login_frontend.request_log import request_logger
 from ratelimit.decorators import ratelimit
 import datetime
 import json
 import logging
 import math
-import os
 import pyotp
 import qrcode
 import re
 import redis
 from django_statsd.clients import statsd as sd
-import sys
 import time
 import urllib
 import urlparse
@@ -54,33 +55,7 @@ r = redis.Redis()
 
 user_log = logging.getLogger("users.%s" % __name__)
 
-@sd.timer("login_frontend.views.custom_log")
-def custom_log(request, message, **kwargs):
-    """ Automatically logs username, remote IP and bid_public """
-    try:
-        raise Exception
-    except:
-        stack = sys.exc_info()[2].tb_frame.f_back
-    if stack is not None:
-        stack = stack.f_back
-    while hasattr(stack, "f_code"):
-        co = stack.f_code
-        filename = os.path.normcase(co.co_filename)
-        filename = co.co_filename
-        lineno = stack.f_lineno
-        co_name = co.co_name
-        break
-
-    level = kwargs.get("level", "info")
-    method = getattr(user_log, level)
-    remote_addr = request.remote_ip
-    bid_public = username = ""
-    if hasattr(request, "browser") and request.browser:
-        bid_public = request.browser.bid_public
-        if request.browser.user:
-            username = request.browser.user.username
-    method("[%s:%s:%s] %s - %s - %s - %s", filename, lineno, co_name,
-                            remote_addr, username, bid_public, message)
+custom_log = request_logger(user_log)
 
     
 @require_http_methods(["GET", "POST"])
@@ -330,6 +305,7 @@ def sessions(request):
                 except Browser.DoesNotExist:
                     ret["message"] = "Invalid browser"
 
+            invalidate_sessions(user)
             if self_logout:
                 get_params = request.GET.dict()
                 get_params["logout"] = "on"
@@ -351,40 +327,20 @@ def sessions(request):
                 messages.success(request, "Browser was renamed as '%s'" % val)
             else:
                 messages.success(request, "Browser name was removed")
+        invalidate_sessions(user)
         return redirect_with_get_params("login_frontend.views.sessions", request.GET)
 
-    browsers = Browser.objects.filter(user=user)
-    sessions = []
-    for browser in browsers:
-        session = BrowserUsers.objects.get(user=user, browser=browser)
-        details = {"session": session, "browser": browser}
-        if browser == request.browser:
+    sessions = load_sessions(user)
+    for details in sessions:
+        if details["browser"] == request.browser:
             details["this_session"] = True
-        details["geo"] = get_geoip_string(session.remote_ip)
-        details["icons"] = browser.get_ua_icons()
-
-        try:
-            details["p0f"] = BrowserP0f.objects.filter(browser=browser).latest()
-        except BrowserP0f.DoesNotExist:
-            pass
+        details["icons"] = details["browser"].get_ua_icons()
 
-        try:
-            details["timesync"] = BrowserTime.objects.filter(browser=browser).latest()
-        except BrowserTime.DoesNotExist:
-            pass
-
-        logins = BrowserLogin.objects.filter(user=user, browser=browser).filter(can_logout=False).filter(signed_out=False).filter(Q(expires_at__gte=timezone.now()) | Q(expires_at=None))
-        details["logins"] = logins
-        cache_keys = [("last_known_location", "last-known-location-%s"), ("last_known_location_from", "last-known-location-from-%s"), ("last_known_location_timestamp", "last-known-location-timestamp-%s")]
-        for tk, k in cache_keys:
-            r_k = k % browser.bid_public
-            val = dcache.get(r_k)
-            if val:
-                if tk == "last_known_location_timestamp":
-                    val = datetime.datetime.fromtimestamp(float(val))
-                details[tk] = val
+    # Last seen information may not be written to database yet.
+    buffered_last_seen([details["session"] for details in sessions])
+    for details in sessions:
+        details["geo"] = get_geoip_string(details["session"].remote_ip)
 
-        sessions.append(details)
     try:
         sessions.sort(key=lambda item:item.get("session").last_seen, reverse=True)
     except Exception, e:
@@ -407,6 +363,7 @@ def sessions(request):
 def view_log(request, **kwargs):
     """ Shows log entries to the user """
     ret = {}
+    write_queued_user_logs([request.browser.user_id])
 
     browsers = {}
     ret["browsers"] = []
@@ -25,3 +25,18 @@ AUTH_USER_MODEL = getattr(settings, 'AUTH_USER_MODEL', 'auth.User')
 # redirected to decide page, set to True to disable this:
 FAILED_DISCOVERY_AS_VALID = getattr(
     settings, 'OPENID_FAILED_DISCOVERY_AS_VALID', False)
+
+# Return URL verification results are cached for this many seconds
+# (verified / failed verification):
+TRUST_ROOT_CACHE_TIMEOUT = getattr(
+    settings, 'OPENID_TRUST_ROOT_CACHE_TIMEOUT', 3600)
+TRUST_ROOT_NEGATIVE_CACHE_TIMEOUT = getattr(
+    settings, 'OPENID_TRUST_ROOT_NEGATIVE_CACHE_TIMEOUT', 300)
+
+# Timeout for fetching relying party for return URL verification:
+TRUST_ROOT_FETCH_TIMEOUT = getattr(
+    settings, 'OPENID_TRUST_ROOT_FETCH_TIMEOUT', 5)
+
+# Number of most used trust roots refreshed in the background:
+TRUST_ROOT_REFRESH_COUNT = getattr(
+    settings, 'OPENID_TRUST_ROOT_REFRESH_COUNT', 50)
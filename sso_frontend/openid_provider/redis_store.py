@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*- vim: set et ts=4 sw=4 :
+"""
+Redis backed OpenID store.
+
+Each association is a hash with its own TTL. Associations for a server URL
+are indexed in a sorted set, scored by expiration time. Nonces are plain
+keys that expire after nonce.SKEW, so no cleanup scans are needed.
+"""
+from hashlib import sha1
+import time
+
+import redis
+from openid.association import Association
+from openid.store import nonce
+from openid.store.interface import OpenIDStore
+
+__all__ = ['RedisOpenIDStore']
+
+ASSOCIATION_KEY = 'openid-assoc-%s-%s'
+ASSOCIATIONS_KEY = 'openid-assocs-%s'
+NONCE_KEY = 'openid-nonce-%s-%s-%s'
+
+
+def _url_hash(server_url):
+    return sha1(server_url).hexdigest()
+
+
+class RedisOpenIDStore(OpenIDStore):
+    """ OpenIDStore implementation on top of redis """
+
+    def __init__(self, redis_instance=None):
+        if redis_instance is None:
+            redis_instance = redis.Redis()
+        self.r = redis_instance
+
+    def storeAssociation(self, server_url, association):
+        url_hash = _url_hash(server_url)
+        expires_at = association.issued + association.lifetime
+        ttl = int(expires_at - time.time())
+        if ttl <= 0:
+            return
+        assoc_key = ASSOCIATION_KEY % (url_hash, association.handle)
+        index_key = ASSOCIATIONS_KEY % url_hash
+        pipe = self.r.pipeline()
+        pipe.hmset(assoc_key, {
+            'secret': association.secret,
+            'issued': association.issued,
+            'lifetime': association.lifetime,
+            'assoc_type': association.assoc_type,
+        })
+        pipe.expire(assoc_key, ttl)
+        pipe.zadd(index_key, association.handle, expires_at)
+        pipe.zremrangebyscore(index_key, 0, time.time())
+        # Index lives as long as the longest association in it.
+        if self.r.ttl(index_key) < ttl:
+            pipe.expire(index_key, ttl)
+        pipe.execute()
+
+    def getAssociation(self, server_url, handle=None):
+        url_hash = _url_hash(server_url)
+        if handle is None:
+            index_key = ASSOCIATIONS_KEY % url_hash
+            self.r.zremrangebyscore(index_key, 0, time.time())
+            handles = self.r.zrange(index_key, 0, -1)
+        else:
+            handles = [handle]
+        if not handles:
+            return None
+
+        pipe = self.r.pipeline(transaction=False)
+        for item in handles:
+            pipe.hgetall(ASSOCIATION_KEY % (url_hash, item))
+        associations = []
+        for (item, data) in zip(handles, pipe.execute()):
+            if not data:
+                continue
+            association = Association(item, data['secret'], int(data['issued']), int(data['lifetime']), data['assoc_type'])
+            if association.getExpiresIn() > 0:
+                associations.append(association)
+        if not associations:
+            return None
+        # Most recently issued association is preferred.
+        return max(associations, key=lambda association: association.issued)
+
+    def removeAssociation(self, server_url, handle):
+        url_hash = _url_hash(server_url)
+        pipe = self.r.pipeline()
+        pipe.delete(ASSOCIATION_KEY % (url_hash, handle))
+        pipe.zrem(ASSOCIATIONS_KEY % url_hash, handle)
+        (deleted, _) = pipe.execute()
+        return bool(deleted)
+
+    def useNonce(self, server_url, timestamp, salt):
+        if abs(timestamp - time.time()) > nonce.SKEW:
+            return False
+        key = NONCE_KEY % (_url_hash(server_url), timestamp, salt)
+        pipe = self.r.pipeline()
+        pipe.setnx(key, 1)
+        pipe.expire(key, nonce.SKEW)
+        (created, _) = pipe.execute()
+        return bool(created)
+
+    def cleanupNonces(self):
+        """ Nonces expire automatically """
+        return 0
+
+    def cleanupAssociations(self):
+        """ Associations expire automatically """
+        return 0
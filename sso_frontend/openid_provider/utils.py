@@ -2,15 +2,37 @@
 # some code from http://www.djangosnippets.org/snippets/310/ by simon
 # and from examples/djopenid from python-openid-2.2.4
 from hashlib import sha1
+import json
+import redis
+import statsd
+import urllib2
 from openid_provider import conf
 from openid.extensions import ax, sreg
 from openid.server.trustroot import verifyReturnTo
 from openid.yadis.discover import DiscoveryFailure
-from openid.fetchers import HTTPFetchingError
+from openid.fetchers import HTTPFetchingError, Urllib2Fetcher, setDefaultFetcher
 
+from django.core.cache import get_cache
 from django.core.exceptions import ImproperlyConfigured
 from django.utils.importlib import import_module
 
+dcache = get_cache("default")
+redis_instance = redis.Redis()
+sd = statsd.StatsClient()
+
+TRUST_ROOT_CACHE_KEY = "openid-trust-root-%s"
+TRUST_ROOT_POPULAR_KEY = "openid-trust-root-popular"
+
+class TimeoutFetcher(Urllib2Fetcher):
+    """
+    Urllib2Fetcher with a bounded timeout, so that slow relying parties
+    can't hold up the login.
+    """
+    def urlopen(self, req):
+        return urllib2.urlopen(req, timeout=conf.TRUST_ROOT_FETCH_TIMEOUT)
+
+setDefaultFetcher(TimeoutFetcher())
+
 def import_module_attr(path):
     package, module = path.rsplit('.', 1)
     return getattr(import_module(package), module)
@@ -71,7 +93,15 @@ def get_ax_callback():
     except (ImportError, AttributeError):
         return None
 
+_store = None
+
 def get_store(request):
+    """
+    Returns OpenID store. Store is instantiated only once per process.
+    """
+    global _store
+    if _store is not None:
+        return _store
     try:
         store_class = import_module_attr(conf.STORE)
     except ImportError:
@@ -79,20 +109,55 @@ def get_store(request):
             "OpenID store %r could not be imported" % conf.STORE)
     # The FileOpenIDStore requires a path to save the user files.
     if conf.STORE == 'openid.store.filestore.FileOpenIDStore':
-        return store_class(conf.FILESTORE_PATH)
-    return store_class()
+        _store = store_class(conf.FILESTORE_PATH)
+    else:
+        _store = store_class()
+    return _store
 
-def trust_root_validation(orequest):
+def verify_trust_root(trust_root, return_to):
     """
-    OpenID specs 9.2.1: using realm for return url verification
+    Verifies return_to against trust_root and caches the result.
     """
     try:
-        return verifyReturnTo(
-            orequest.trust_root, orequest.return_to) and "Valid" or "Invalid"
+        result = verifyReturnTo(trust_root, return_to) and "Valid" or "Invalid"
     except HTTPFetchingError:
-        return "Unreachable"
+        result = "Unreachable"
     except DiscoveryFailure:
-        return "DISCOVERY_FAILED"
+        result = "DISCOVERY_FAILED"
+    if result == "Valid":
+        timeout = conf.TRUST_ROOT_CACHE_TIMEOUT
+    else:
+        timeout = conf.TRUST_ROOT_NEGATIVE_CACHE_TIMEOUT
+    dcache.set(TRUST_ROOT_CACHE_KEY % sha1(trust_root + return_to).hexdigest(), result, timeout)
+    return result
+
+def trust_root_validation(orequest):
+    """
+    OpenID specs 9.2.1: using realm for return url verification
+
+    Results are cached, as verification fetches the relying party.
+    """
+    redis_instance.zincrby(TRUST_ROOT_POPULAR_KEY, json.dumps([orequest.trust_root, orequest.return_to]), 1)
+    result = dcache.get(TRUST_ROOT_CACHE_KEY % sha1(orequest.trust_root + orequest.return_to).hexdigest())
+    if result is not None:
+        sd.incr("openid_provider.trust_root_validation.cache_hit")
+        return result
+    sd.incr("openid_provider.trust_root_validation.cache_miss")
+    return verify_trust_root(orequest.trust_root, orequest.return_to)
+
+def refresh_popular_trust_roots():
+    """
+    Verifies most used (trust_root, return_to) pairs since the last run
+    again, so that they are always found from the cache.
+    """
+    pipe = redis_instance.pipeline()
+    pipe.zrevrange(TRUST_ROOT_POPULAR_KEY, 0, conf.TRUST_ROOT_REFRESH_COUNT - 1)
+    pipe.delete(TRUST_ROOT_POPULAR_KEY)
+    (popular, _) = pipe.execute()
+    for item in popular:
+        (trust_root, return_to) = json.loads(item)
+        verify_trust_root(trust_root, return_to)
+    return len(popular)
 
 def get_trust_session_key(orequest):
     return 'OPENID_' + sha1(
@@ -22,6 +22,7 @@ except ImportError:
 
 
 from login_frontend.models import BrowserLogin, add_user_log
+from login_frontend.request_log import request_logger
 
 from django.utils import timezone
 from django.contrib.auth import REDIRECT_FIELD_NAME
@@ -38,41 +39,13 @@ from openid_provider.utils import add_sreg_data, add_ax_data, get_store, \
 from openid_provider.models import TrustedRoot, OpenID
 from django.contrib.auth.models import User as DjangoUser
 import statsd
-import sys
-import os
 
 logger = logging.getLogger(__name__)
 log = logging.getLogger(__name__)
 
 sd = statsd.StatsClient()
 
-@sd.timer("openid_provider.views.custom_log")
-def custom_log(request, message, **kwargs):
-    """ Automatically logs username, remote IP and bid_public """
-    try:
-        raise Exception
-    except:
-        stack = sys.exc_info()[2].tb_frame.f_back
-    if stack is not None:
-        stack = stack.f_back
-    while hasattr(stack, "f_code"):
-        co = stack.f_code
-        filename = os.path.normcase(co.co_filename)
-        filename = co.co_filename
-        lineno = stack.f_lineno
-        co_name = co.co_name
-        break
-
-    level = kwargs.get("level", "info")
-    method = getattr(log, level)
-    remote_addr = request.remote_ip
-    bid_public = username = ""
-    if hasattr(request, "browser") and request.browser:
-        bid_public = request.browser.bid_public
-        if request.browser.user:
-            username = request.browser.user.username
-    method("[%s:%s:%s] %s - %s - %s - %s", filename, lineno, co_name,
-                            remote_addr, username, bid_public, message)
+custom_log = request_logger(log)
 
 
 
@@ -131,9 +104,6 @@ def openid_server(request):
         openid = openid_is_authorized(request, orequest.identity,
                                       orequest.trust_root)
 
-        # verify return_to:
-        trust_root_valid = trust_root_validation(orequest)
-        custom_log(request, "trust_root_valid=%s" % trust_root_valid, level="debug")
         validated = False
 
         # Allow per-url exceptions for trust roots.
@@ -143,6 +113,13 @@ def openid_server(request):
                 validated = True
                 break
 
+        # verify return_to. Always trusted roots are not fetched.
+        if validated:
+            trust_root_valid = "Valid"
+        else:
+            trust_root_valid = trust_root_validation(orequest)
+        custom_log(request, "trust_root_valid=%s" % trust_root_valid, level="debug")
+
         if conf.FAILED_DISCOVERY_AS_VALID:
             if trust_root_valid == 'DISCOVERY_FAILED' or trust_root_valid == 'Unreachable':
                 custom_log(request, "Setting validated=True as FAILED_DISCOVERY_AS_VALID is True", level="debug")
@@ -0,0 +1,114 @@
+"""
+Streaming SAML 2.0 AuthnRequest parser.
+
+Uses expat directly. Only the root element and its Issuer child are read;
+parsing stops as soon as Issuer has been closed. Documents with DTDs (and
+thus entity declarations) are rejected, and documents larger than
+MAX_REQUEST_SIZE are not parsed at all.
+
+Returned values are XML-escaped, as they are inserted to response templates
+as-is.
+"""
+from xml.parsers import expat
+from xml.sax.saxutils import escape
+
+__all__ = ['MAX_REQUEST_SIZE', 'InvalidAuthnRequest', 'parse_authn_request']
+
+# AuthnRequests are a few kilobytes at most.
+MAX_REQUEST_SIZE = 64 * 1024
+
+# Namespaces are not checked; only local names are compared.
+NS_SEPARATOR = ' '
+
+# Request parameter -> AuthnRequest attribute
+ATTRIBUTES = (
+    ('ACS_URL', 'AssertionConsumerServiceURL'),
+    ('REQUEST_ID', 'ID'),
+    ('DESTINATION', 'Destination'),
+    ('PROVIDER_NAME', 'ProviderName'),
+)
+REQUIRED = ('ACS_URL', 'REQUEST_ID')
+
+
+class InvalidAuthnRequest(Exception):
+    """
+    AuthnRequest is malformed, too large or uses forbidden XML features.
+    """
+    pass
+
+
+class _Done(Exception):
+    """
+    Raised from handlers to stop parsing once everything is read.
+    """
+    pass
+
+
+def _escape(value):
+    return escape(value, {'"': '&quot;'})
+
+
+def _local_name(name):
+    return name.rsplit(NS_SEPARATOR, 1)[-1]
+
+
+class _Handler(object):
+    def __init__(self):
+        self.params = None
+        self.depth = 0
+        self.issuer = None # list of text chunks while inside Issuer
+
+    def start_element(self, name, attrs):
+        self.depth += 1
+        if self.depth == 1:
+            if _local_name(name) != 'AuthnRequest':
+                raise InvalidAuthnRequest('Root element is not AuthnRequest: %s' % name)
+            self.params = dict([(param, _escape(attrs.get(attr, ''))) for (param, attr) in ATTRIBUTES])
+            self.params['REQUEST_ISSUER'] = ''
+        elif self.depth == 2 and _local_name(name) == 'Issuer':
+            self.issuer = []
+
+    def end_element(self, name):
+        self.depth -= 1
+        if self.issuer is not None:
+            self.params['REQUEST_ISSUER'] = _escape(''.join(self.issuer).strip())
+            raise _Done()
+
+    def character_data(self, data):
+        if self.issuer is not None:
+            self.issuer.append(data)
+
+    def forbidden(self, *args):
+        raise InvalidAuthnRequest('DTDs and entities are not allowed')
+
+
+def parse_authn_request(request_xml):
+    """
+    Returns dict with ACS_URL, REQUEST_ID, DESTINATION, PROVIDER_NAME and
+    REQUEST_ISSUER from AuthnRequest XML. Raises InvalidAuthnRequest on failure.
+    """
+    if len(request_xml) > MAX_REQUEST_SIZE:
+        raise InvalidAuthnRequest('AuthnRequest is larger than %s bytes' % MAX_REQUEST_SIZE)
+    handler = _Handler()
+    parser = expat.ParserCreate(namespace_separator=NS_SEPARATOR)
+    parser.StartElementHandler = handler.start_element
+    parser.EndElementHandler = handler.end_element
+    parser.CharacterDataHandler = handler.character_data
+    parser.StartDoctypeDeclHandler = handler.forbidden
+    parser.EntityDeclHandler = handler.forbidden
+    parser.UnparsedEntityDeclHandler = handler.forbidden
+    parser.ExternalEntityRefHandler = handler.forbidden
+    try:
+        parser.Parse(request_xml, True)
+    except _Done:
+        pass
+    except expat.ExpatError, e:
+        raise InvalidAuthnRequest('AuthnRequest is not valid XML: %s' % e)
+
+    params = handler.params
+    if params is None:
+        raise InvalidAuthnRequest('AuthnRequest is empty')
+    for param in REQUIRED:
+        if not params[param]:
+            raise InvalidAuthnRequest('AuthnRequest is missing %s' % param)
+    return params
@@ -4,12 +4,13 @@ import logging
 import time
 import uuid
 # Django and other library imports:
-from BeautifulSoup import BeautifulStoneSoup
 from django.core.exceptions import ImproperlyConfigured
 from django.core.cache import get_cache
 # local app imports:
+import authn_request
 import codex
 import exceptions
+import metadata
 import saml2idp_metadata
 import xml_render
 
@@ -24,6 +25,50 @@ import logging
 log = logging.getLogger(__name__)
 
 
+def get_stored_saml_request(saml_id):
+    """
+    Returns SAMLRequest stored by login_begin, or None.
+    """
+    return dcache.get("saml-SAMLRequest-%s" % saml_id)
+
+def _request_cache(django_request):
+    """
+    Returns per-request dict for decoded and parsed AuthnRequests.
+    """
+    cache = getattr(django_request, "_saml2idp_cache", None)
+    if cache is None:
+        cache = {}
+        django_request._saml2idp_cache = cache
+    return cache
+
+def decode_saml_request(django_request, saml_request, inflate=False):
+    """
+    Returns AuthnRequest XML from base64 encoded (and optionally deflated)
+    saml_request. Results are kept for the duration of django_request, so
+    registry.find_processor and processors do not decode the same request
+    twice.
+    """
+    cache = _request_cache(django_request)
+    key = ("xml", inflate, saml_request)
+    if key not in cache:
+        if inflate:
+            cache[key] = codex.decode_base64_and_inflate(saml_request, authn_request.MAX_REQUEST_SIZE)
+        else:
+            cache[key] = base64.b64decode(saml_request)
+    return cache[key]
+
+def parse_request_xml(django_request, request_xml):
+    """
+    Returns parameters parsed from AuthnRequest XML. Results are kept for
+    the duration of django_request.
+    """
+    cache = _request_cache(django_request)
+    key = ("params", request_xml)
+    if key not in cache:
+        cache[key] = authn_request.parse_authn_request(request_xml)
+    # Processors update their request parameters.
+    return dict(cache[key])
+
 def get_random_id():
     #NOTE: It is very important that these random IDs NOT start with a number.
     random_id = '_' + uuid.uuid4().hex
@@ -90,7 +135,7 @@ class Processor(object):
         """
         Decodes _request_xml from _saml_request.
         """
-        self._request_xml = base64.b64decode(self._saml_request)
+        self._request_xml = decode_saml_request(self._django_request, self._saml_request)
 
     def _determine_assertion_id(self):
         """
@@ -137,7 +182,7 @@ class Processor(object):
         """
         saml_id = self._django_request.GET.get("saml_id")
 
-        self._saml_request = dcache.get("saml-SAMLRequest-%s" % saml_id)
+        self._saml_request = get_stored_saml_request(saml_id)
         self._relay_state = dcache.get("saml-RelayState-%s" % saml_id)
         if self._saml_request == None or self._relay_state == None:
             return False
@@ -177,14 +222,7 @@ class Processor(object):
             badXML = self._request_xml
             raise Exception('RequestXML is not valid XML; '
                             'it may need to be decoded or decompressed.')
-        soup = BeautifulStoneSoup(self._request_xml)
-        request = soup.findAll()[0]
-        params = {}
-        params['ACS_URL'] = request['assertionconsumerserviceurl']
-        params['REQUEST_ID'] = request['id']
-        params['DESTINATION'] = request.get('destination', '')
-        params['PROVIDER_NAME'] = request.get('providername', '')
-        self._request_params = params
+        self._request_params = parse_request_xml(self._django_request, self._request_xml)
 
     def _reset(self, django_request, sp_config=None):
         """
@@ -218,10 +256,10 @@ class Processor(object):
         throw a CannotHandleAssertion Exception if the validation does not succeed.
         """
         acs_url = self._request_params['ACS_URL']
-        for name, sp_config in saml2idp_metadata.SAML2IDP_REMOTES.items():
-            if acs_url == sp_config['acs_url']:
-                self._sp_config = sp_config
-                return
+        sp_config = metadata.find_config_for_acs(acs_url)
+        if sp_config is not None:
+            self._sp_config = sp_config
+            return
         msg = "Could not find ACS url '%s' in SAML2IDP_REMOTES setting." % acs_url
         raise exceptions.CannotHandleAssertion(msg)
 
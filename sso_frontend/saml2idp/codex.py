@@ -3,9 +3,16 @@
 import zlib
 import base64
 
-def decode_base64_and_inflate( b64string ):
+def decode_base64_and_inflate( b64string, max_length=0 ):
+    """ If max_length is set, raises ValueError if inflated data would be longer. """
     decoded_data = base64.b64decode( b64string )
-    return zlib.decompress( decoded_data , -15)
+    if not max_length:
+        return zlib.decompress( decoded_data , -15)
+    decompressor = zlib.decompressobj(-15)
+    inflated_data = decompressor.decompress( decoded_data, max_length )
+    if decompressor.unconsumed_tail:
+        raise ValueError("Inflated data is longer than %s bytes" % max_length)
+    return inflated_data
 
 def deflate_and_base64_encode( string_val ):
     zlibbed_str = zlib.compress( string_val )
@@ -0,0 +1,67 @@
+"""
+Precompiled versions of templates in xml_templates.
+
+Each string.Template is converted to %-format string(s) once, at import.
+Rendering is a single % operation, instead of parsing the template again
+on every call.
+
+Templates with a signature placeholder are split at that placeholder. The
+parts are rendered once; unsigned XML is head + tail, and signed XML is
+head + signature + tail, without a second substitution.
+"""
+import string
+import xml_templates
+
+
+def _compile(template):
+    """
+    Converts string.Template syntax to %-format string.
+    """
+    def convert(match):
+        if match.group('escaped') is not None:
+            return '$'
+        name = match.group('named') or match.group('braced')
+        if name is None:
+            raise ValueError('Invalid placeholder in template: %s' % match.group(0))
+        return '%%(%s)s' % name
+    return string.Template.pattern.sub(convert, template.replace('%', '%%'))
+
+
+class CompiledTemplate(object):
+    """
+    string.Template compatible template. If slot is given, template is
+    split at ${slot}; use render_parts() to get the parts around it.
+    """
+    def __init__(self, template, slot=None):
+        if slot is None:
+            parts = [template]
+        else:
+            parts = template.split('${%s}' % slot)
+            if len(parts) != 2:
+                raise ValueError('Placeholder %s must appear exactly once' % slot)
+        self.slot = slot
+        self.formats = [_compile(part) for part in parts]
+
+    def render(self, params):
+        """
+        Returns rendered template. Same as string.Template(...).substitute(params).
+        """
+        if self.slot is not None:
+            raise ValueError('Use render_parts() for templates with slot')
+        return self.formats[0] % params
+
+    def render_parts(self, params):
+        """
+        Returns (head, tail) around the slot.
+        """
+        return tuple([part % params for part in self.formats])
+
+
+SIGNED_INFO = CompiledTemplate(xml_templates.SIGNED_INFO)
+SIGNATURE = CompiledTemplate(xml_templates.SIGNATURE)
+ATTRIBUTE = CompiledTemplate(xml_templates.ATTRIBUTE)
+ATTRIBUTE_STATEMENT = CompiledTemplate(xml_templates.ATTRIBUTE_STATEMENT)
+SUBJECT = CompiledTemplate(xml_templates.SUBJECT)
+ASSERTION_GOOGLE_APPS = CompiledTemplate(xml_templates.ASSERTION_GOOGLE_APPS, 'ASSERTION_SIGNATURE')
+ASSERTION_SALESFORCE = CompiledTemplate(xml_templates.ASSERTION_SALESFORCE, 'ASSERTION_SIGNATURE')
+RESPONSE = CompiledTemplate(xml_templates.RESPONSE, 'RESPONSE_SIGNATURE')
@@ -11,7 +11,7 @@ class Processor(base.Processor):
         """
         Decodes request using both Base64 and Zipping.
         """
-        self._request_xml = codex.decode_base64_and_inflate(self._saml_request)
+        self._request_xml = base.decode_saml_request(self._django_request, self._saml_request, inflate=True)
 
     def _validate_request(self):
         """
@@ -10,24 +10,47 @@ def get_config_for_acs(acs_url):
     """
     Return SP configuration instance that handles acs_url.
     """
-    for friendlyname, config in SAML2IDP_REMOTES.items():
-        if config['acs_url'] == acs_url:
-            return config
+    config = find_config_for_acs(acs_url)
+    if config is not None:
+        return config
     msg = 'SAML2IDP_REMOTES is not configured to handle the AssertionConsumerService at "%s"'
-    raise ImproperlyConfigured(msg % resource_name)
+    raise ImproperlyConfigured(msg % acs_url)
+
+def find_config_for_acs(acs_url):
+    """
+    Return SP configuration instance that handles acs_url, or None.
+    """
+    return _get_indexes()[0].get(acs_url)
 
 def get_config_for_resource(resource_name):
     """
     Return the SP configuration that handles a deep-link resource_name.
     """
-    for friendlyname, config in SAML2IDP_REMOTES.items():
-        links = get_links(config)
-        for name, pattern in links:
-            if name == resource_name:
-                return config
+    config = _get_indexes()[1].get(resource_name)
+    if config is not None:
+        return config
     msg = 'SAML2IDP_REMOTES is not configured to handle a link resource "%s"'
     raise ImproperlyConfigured(msg % resource_name)
 
+_indexes = None
+
+def _get_indexes():
+    """
+    Returns ({acs_url: config}, {resource: config}), built once from
+    SAML2IDP_REMOTES. If more than one SP matches, the first one is used,
+    like the linear scan did.
+    """
+    global _indexes
+    if _indexes is None:
+        by_acs = {}
+        by_resource = {}
+        for friendlyname, config in SAML2IDP_REMOTES.items():
+            by_acs.setdefault(config['acs_url'], config)
+            for name, pattern in get_links(config):
+                by_resource.setdefault(name, config)
+        _indexes = (by_acs, by_resource)
+    return _indexes
+
 def get_deeplink_resources():
     """
     Returns a list of resources that can be used for deep-linking.
@@ -7,19 +7,23 @@ import logging
 from django.utils.importlib import import_module
 from django.core.exceptions import ImproperlyConfigured
 # Local imports
+import base
 import exceptions
+import metadata
 import saml2idp_metadata
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
-def get_processor(dottedpath):
-    """
-    Get an instance of the processor with dottedpath.
+_processor_classes = {}
 
-    For example:
-    >>> x = get_processor('saml2idp.demo.Processor')
+def get_processor_class(dottedpath):
     """
+    Returns processor class for dottedpath. Classes are imported only once.
+    """
+    sp_class = _processor_classes.get(dottedpath)
+    if sp_class is not None:
+        return sp_class
     logger.debug("Trying get_processor with %s" % dottedpath)
     try:
         dot = dottedpath.rindex('.')
@@ -34,14 +38,56 @@ def get_processor(dottedpath):
         sp_class = getattr(mod, sp_classname)
     except AttributeError:
         raise ImproperlyConfigured('processors module "%s" does not define a "%s" class' % (sp_module, sp_classname))
+    _processor_classes[dottedpath] = sp_class
+    return sp_class
 
-    instance = sp_class()
-    return instance
+def get_processor(dottedpath):
+    """
+    Get an instance of the processor with dottedpath.
+
+    For example:
+    >>> x = get_processor('saml2idp.demo.Processor')
+    """
+    # Processors keep per-request state, so a new instance is always returned.
+    return get_processor_class(dottedpath)()
+
+def peek_acs_url(request):
+    """
+    Returns AssertionConsumerServiceURL from stored AuthnRequest, or None
+    if it is not available. Decoded and parsed request is kept on request,
+    and reused by Processor.can_handle.
+    """
+    saml_request = base.get_stored_saml_request(request.GET.get("saml_id"))
+    if saml_request is None:
+        return None
+    for inflate in (True, False):
+        try:
+            request_xml = base.decode_saml_request(request, saml_request, inflate=inflate)
+            return base.parse_request_xml(request, request_xml)['ACS_URL']
+        except Exception:
+            continue
+    return None
 
 def find_processor(request):
     """
     Returns the Processor instance that is willing to handle this request.
+
+    Processor is selected by AssertionConsumerServiceURL of the request.
+    If that is not available, or the selected processor refuses the
+    request, every processor is tried in turn.
     """
+    acs_url = peek_acs_url(request)
+    if acs_url is not None:
+        sp_config = metadata.find_config_for_acs(acs_url)
+        if sp_config is not None:
+            proc = get_processor(sp_config['processor'])
+            try:
+                if proc.can_handle(request):
+                    return proc
+            except exceptions.CannotHandleAssertion, e:
+                # For example, several remotes share the ACS URL.
+                logger.debug('%s %s' % (proc, e))
+
     for name, sp_config in saml2idp_metadata.SAML2IDP_REMOTES.items():
         proc = get_processor(sp_config['processor'])
         try:
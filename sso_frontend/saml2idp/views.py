@@ -25,10 +25,9 @@ import xml_signing
 
 from login_frontend.utils import redirect_with_get_params
 from login_frontend.models import BrowserLogin, add_user_log
+from login_frontend.request_log import request_logger
 
 from django.utils import timezone
-import os
-import sys
 import statsd
 from utils import get_destination_service, parse_google_saml
 from django.core.cache import get_cache
@@ -40,33 +39,7 @@ log = logging.getLogger(__name__)
 
 sd = statsd.StatsClient()
 
-@sd.timer("saml2idp.views.custom_log")
-def custom_log(request, message, **kwargs):
-    """ Automatically logs username, remote IP and bid_public """
-    try:
-        raise Exception
-    except:
-        stack = sys.exc_info()[2].tb_frame.f_back
-    if stack is not None:
-        stack = stack.f_back
-    while hasattr(stack, "f_code"):
-        co = stack.f_code
-        filename = os.path.normcase(co.co_filename)
-        filename = co.co_filename
-        lineno = stack.f_lineno
-        co_name = co.co_name
-        break
-
-    level = kwargs.get("level", "info")
-    method = getattr(log, level)
-    remote_addr = request.remote_ip
-    bid_public = username = ""
-    if hasattr(request, "browser") and request.browser:
-        bid_public = request.browser.bid_public
-        if request.browser.user:
-            username = request.browser.user.username
-    method("[%s:%s:%s] %s - %s - %s - %s", filename, lineno, co_name,
-                            remote_addr, username, bid_public, message)
+custom_log = request_logger(log)
 
 
 def _generate_response(request, processor):
@@ -2,10 +2,8 @@
 Functions for creating XML output.
 """
 import logging
-import string
+import compiled_templates
 from xml_signing import get_signature_xml
-from xml_templates import ATTRIBUTE, ATTRIBUTE_STATEMENT, \
-    ASSERTION_GOOGLE_APPS, ASSERTION_SALESFORCE, RESPONSE, SUBJECT
 
 log = logging.getLogger(__name__)
 
@@ -22,17 +20,14 @@ def _get_attribute_statement(params):
         params['ATTRIBUTE_STATEMENT'] = ''
         return
     # Build individual attribute list.
-    template = string.Template(ATTRIBUTE)
+    attribute = compiled_templates.ATTRIBUTE
     attr_list = []
     for name, value in attributes.items():
         subs = { 'ATTRIBUTE_NAME': name, 'ATTRIBUTE_VALUE': value }
-        one = template.substitute(subs)
-        attr_list.append(one)
+        attr_list.append(attribute.render(subs))
     params['ATTRIBUTES'] = ''.join(attr_list)
     # Build complete AttributeStatement.
-    stmt_template = string.Template(ATTRIBUTE_STATEMENT)
-    statement = stmt_template.substitute(params)
-    params['ATTRIBUTE_STATEMENT'] = statement
+    params['ATTRIBUTE_STATEMENT'] = compiled_templates.ATTRIBUTE_STATEMENT.render(params)
 
 def _get_in_response_to(params):
     """
@@ -54,64 +49,52 @@ def _get_subject(params):
     Insert Subject.
     Modifies the params dict.
     """
-    template = string.Template(SUBJECT)
-    params['SUBJECT_STATEMENT'] = template.substitute(params)
+    params['SUBJECT_STATEMENT'] = compiled_templates.SUBJECT.render(params)
+
+def _render(template, params, reference_uri, signed):
+    """
+    Renders template once. If signed is True, signature of the unsigned
+    XML is inserted to the template slot.
+    """
+    (head, tail) = template.render_parts(params)
+    unsigned = head + tail
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug('Unsigned:')
+        log.debug(unsigned)
+    if not signed:
+        return unsigned
+
+    # Sign it.
+    signature_xml = get_signature_xml(unsigned, reference_uri)
+    signed = head + signature_xml + tail
+
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug('Signed:')
+        log.debug(signed)
+    return signed
 
 def _get_assertion_xml(template, parameters, signed=False):
-    # Reset signature.
     params = {}
     params.update(parameters)
-    params['ASSERTION_SIGNATURE'] = ''
-    template = string.Template(template)
 
     _get_in_response_to(params)
     _get_subject(params) # must come before _get_attribute_statement()
     _get_attribute_statement(params)
 
-    unsigned = template.substitute(params)
-    log.debug('Unsigned:')
-    log.debug(unsigned)
-    if not signed:
-        return unsigned
-
-    # Sign it.
-    signature_xml = get_signature_xml(unsigned, params['ASSERTION_ID'])
-    params['ASSERTION_SIGNATURE'] = signature_xml
-    signed = template.substitute(params)
-
-    log.debug('Signed:')
-    log.debug(signed)
-    return signed
+    return _render(template, params, params['ASSERTION_ID'], signed)
 
 def get_assertion_googleapps_xml(parameters, signed=False):
-    return _get_assertion_xml(ASSERTION_GOOGLE_APPS, parameters, signed)
+    return _get_assertion_xml(compiled_templates.ASSERTION_GOOGLE_APPS, parameters, signed)
 
 def get_assertion_salesforce_xml(parameters, signed=False):
-    return _get_assertion_xml(ASSERTION_SALESFORCE, parameters, signed)
+    return _get_assertion_xml(compiled_templates.ASSERTION_SALESFORCE, parameters, signed)
 
 def get_response_xml(parameters, signed=False):
     """
     Returns XML for response, with signatures, if signed is True.
     """
-    # Reset signatures.
     params = {}
     params.update(parameters)
-    params['RESPONSE_SIGNATURE'] = ''
     _get_in_response_to(params)
 
-    template = string.Template(RESPONSE)
-    unsigned = template.substitute(params)
-
-    log.debug('Unsigned:')
-    log.debug(unsigned)
-    if not signed:
-        return unsigned
-
-    # Sign it.
-    signature_xml = get_signature_xml(unsigned, params['RESPONSE_ID'])
-    params['RESPONSE_SIGNATURE'] = signature_xml
-    signed = template.substitute(params)
-
-    log.debug('Signed:')
-    log.debug(signed)
-    return signed
+    return _render(compiled_templates.RESPONSE, params, params['RESPONSE_ID'], signed)
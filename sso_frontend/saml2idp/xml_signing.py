@@ -4,24 +4,50 @@ Signing code goes here.
 # python:
 import hashlib
 import logging
-import string
+import os
 # other libraries:
 import M2Crypto
 # this app:
 import saml2idp_metadata
 from codex import nice64
-from xml_templates import SIGNED_INFO, SIGNATURE
+from compiled_templates import SIGNED_INFO, SIGNATURE
 
 log = logging.getLogger(__name__)
 
+# (filename, loader) -> (mtime, loaded object)
+_file_cache = {}
+
+def _load_cached(filename, loader):
+    """
+    Returns loader(filename). Result is cached per process, and reloaded
+    when file modification time changes (for example, on key rotation).
+    """
+    mtime = os.stat(filename).st_mtime
+    cached = _file_cache.get((filename, loader))
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    log.info('Loading %s', filename)
+    value = loader(filename)
+    _file_cache[(filename, loader)] = (mtime, value)
+    return value
+
+def _read_cert_data(certificate_file):
+    certificate = M2Crypto.X509.load_cert(certificate_file)
+    return ''.join(certificate.as_pem().split('\n')[1:-2])
 
 def load_cert_data(certificate_file):
     """
     Returns the certificate data out of the certificate_file.
     """
-    certificate = M2Crypto.X509.load_cert(certificate_file)
-    cert_data = ''.join(certificate.as_pem().split('\n')[1:-2])
-    return cert_data
+    return _load_cached(certificate_file, _read_cert_data)
+
+def load_private_key(private_key_file):
+    """
+    Returns M2Crypto.RSA key from private_key_file.
+    """
+    # RSA.sign does not keep state in key object (unlike EVP.PKey.sign_*),
+    # so the same key can be used by multiple threads.
+    return _load_cached(private_key_file, M2Crypto.RSA.load_key)
 
 def get_signature_xml(subject, reference_uri):
     """
@@ -30,40 +56,44 @@ def get_signature_xml(subject, reference_uri):
     config = saml2idp_metadata.SAML2IDP_CONFIG
     private_key_file = config['private_key_file']
     certificate_file = config['certificate_file']
-    log.debug('get_signature_xml - Begin.')
-    log.debug('Using private key file: ' + private_key_file)
-    log.debug('Using certificate file: ' + certificate_file)
-    log.debug('Subject: ' + subject)
+    debug = log.isEnabledFor(logging.DEBUG)
+    if debug:
+        log.debug('get_signature_xml - Begin.')
+        log.debug('Using private key file: ' + private_key_file)
+        log.debug('Using certificate file: ' + certificate_file)
+        log.debug('Subject: ' + subject)
 
     # Hash the subject.
     subject_hash = hashlib.sha1()
     subject_hash.update(subject)
     subject_digest = nice64(subject_hash.digest())
-    log.debug('Subject digest: ' + subject_digest)
+    if debug:
+        log.debug('Subject digest: ' + subject_digest)
 
     # Create signed_info.
-    signed_info = string.Template(SIGNED_INFO).substitute({
+    signed_info = SIGNED_INFO.render({
         'REFERENCE_URI': reference_uri,
         'SUBJECT_DIGEST': subject_digest,
         })
-    log.debug('SignedInfo XML: ' + signed_info)
+    if debug:
+        log.debug('SignedInfo XML: ' + signed_info)
 
-    # RSA-sign the signed_info.
-    private_key = M2Crypto.EVP.load_key(private_key_file)
-    private_key.sign_init()
-    private_key.sign_update(signed_info)
-    rsa_signature = nice64(private_key.sign_final())
-    log.debug('RSA Signature: ' + rsa_signature)
+    # RSA-sign the signed_info (RSA-SHA1, PKCS#1 v1.5).
+    private_key = load_private_key(private_key_file)
+    rsa_signature = nice64(private_key.sign(hashlib.sha1(signed_info).digest(), 'sha1'))
+    if debug:
+        log.debug('RSA Signature: ' + rsa_signature)
 
     # Load the certificate.
     cert_data = load_cert_data(certificate_file)
 
     # Put the signed_info and rsa_signature into the XML signature.
     signed_info_short = signed_info.replace(' xmlns:ds="http://www.w3.org/2000/09/xmldsig#"', '')
-    signature_xml = string.Template(SIGNATURE).substitute({
+    signature_xml = SIGNATURE.render({
         'RSA_SIGNATURE': rsa_signature,
         'SIGNED_INFO': signed_info_short,
         'CERTIFICATE': cert_data,
         })
-    log.debug('Signature XML: ' + signature_xml)
+    if debug:
+        log.debug('Signature XML: ' + signature_xml)
     return signature_xml
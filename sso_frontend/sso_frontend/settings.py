@@ -78,6 +78,8 @@ CACHES = {
 
 PROJECT_ROOT = os.path.join(os.path.dirname(__file__), '../')
 GEOIP_DB = PROJECT_ROOT+"data/GeoLite2-City.mmdb"
+GEOIP_CACHE_SIZE = 10000 # location strings cached per process
+GEOIP_RELOAD_CHECK_INTERVAL = 60 # seconds. GeoIP database is reloaded if the file has changed.
 
 
 LOGIN_REDIRECT_URL = URL_PREFIX+'/idp/sso/post/response/preview/'
@@ -441,15 +443,44 @@ LDAP_SERVER = None # for example, "ldaps://ldap.example.com"
 LDAP_USER_BASE_DN = None # for example, "uid=%s,ou=People,dc=example,dc=com"
 LDAP_GROUPS_BASE_DN = None # for example, "ou=Groups,dc=example,dc=com"
 LDAP_IGNORE_SSL=False # skip LDAP SSL certificate checks
+LDAP_POOL_SIZE = 10 # maximum number of persistent LDAP connections per process
+LDAP_POOL_CHECK_INTERVAL = 60 # seconds. Idle pooled connections are checked before use after this.
+LDAP_BIND_DN = None # Service account for refreshing cached group memberships. If None, memberships are not refreshed in background.
+LDAP_BIND_PASSWORD = None
+LDAP_GROUPS_CACHE_TIMEOUT = 3600 # seconds
+LDAP_GROUPS_ACTIVE_WINDOW = 86400 * 7 # seconds. Refresh group memberships for users who logged in during this time.
 TOKEN_MAP = {} # map of LDAP groups to pubtkt tokens. For example, {"Administrators": "admins", "ExternalContractors": "ext"}
 
 FAKE_TESTING = False # This uses LDAP stub and static SMS codes. Useful for smoke testing, but never set in production.
 
 AUTHENTICATOR_NAME = "%s@hostname -%s-"
+AUTHENTICATOR_OLD_SECRETS_MAX = 10 # Number of old Authenticator configurations checked for helpful error messages
 
 
 P0F_SOCKET = None
 
+BROWSER_CACHE_ENABLED = False # Cache Browser and User rows in "default" cache, keyed by bid
+BROWSER_CACHE_TIMEOUT = 300 # seconds
+
+SESSIONS_CACHE_TIMEOUT = 10 # seconds. Sessions page data is cached per user.
+
+BROWSER_USERS_BUFFER_ENABLED = False # Buffer BrowserUsers last seen updates in redis, written by huey task
+BROWSER_USERS_BUFFER_MAX_AGE = 120 # seconds. Flush is scheduled immediately if buffer is older than this.
+BROWSER_USERS_BUFFER_BATCH_SIZE = 500 # rows per UPDATE statement
+
+USER_LOG_ASYNC = False # Queue user log entries (add_user_log) in redis, written by huey task
+USER_LOG_BATCH_SIZE = 500 # rows per INSERT statement
+
+CSP_REPORTS_ASYNC = False # Queue CSP reports in redis, written by huey task
+CSP_REPORTS_PER_MINUTE = 30 # per browser (or IP address, if browser is not known). Extra reports are dropped.
+CSP_QUEUE_MAX_LENGTH = 10000 # reports. Extra reports are dropped.
+CSP_BATCH_SIZE = 500 # rows per INSERT statement
+CSP_FINGERPRINT_TIMEOUT = 86400 * 7 # seconds. Identical reports are not stored again during this time.
+
+SMS_QUEUE_ENABLED = False # Send SMS messages with huey workers instead of during the request
+SMS_SEND_ATTEMPTS = 4 # Number of attempts per phone number
+SMS_RETRY_DELAY = 5 # seconds. Doubled after each failed attempt.
+
 PUBTKT_PRIVKEY=None
 PUBTKT_PUBKEY=None
 PUBTKT_ALLOWED_DOMAINS=[]
@@ -461,6 +492,7 @@ FUM_API_ENDPOINT=None
 FUM_ACCESS_TOKEN=None
 
 OPENID_PROVIDER_AX_EXTENSION=True
+OPENID_PROVIDER_STORE='openid_provider.redis_store.RedisOpenIDStore'
 OPENID_FAILED_DISCOVERY_AS_VALID=False
 OPENID_TRUSTED_ROOTS=[]
 